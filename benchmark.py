@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+A benchmark for process_fixation_output.py.
+
+This generates a folder with synthetic Fixation output (JNF, agc and ags files) at a configurable scale, and times
+every processing stage of process_fixation_output.py on it. The results are written as JSON, so that they can be
+compared between versions of the script. When a baseline is supplied, the benchmark fails if a stage got slower.
+
+Example: python benchmark.py --participants 50 --output results.json --compare baseline.json
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+
+import process_fixation_output as p
+
+"*** Variables ***"
+
+# The stages that are timed, in the order they are run
+_stages = ['sort_jnf_file', 'make_trt', 'make_trt_hashed', 'make_trt_numpy', 'make_act', 'combine_act_files',
+           'combine_ags_files']
+
+# Use the most precise timer available
+_timer = getattr(time, 'perf_counter', time.time)
+
+"*** Synthetic data ***"
+
+_jnf_header = ('expname imgfile timfile blocknr subjectnr pagenr fixnr X Y fixstart fixdur SaccInDur SaccOutDur Qual '
+               'Mark obtnr oldobtnr wlen nwonl twonl ncharl nwonp nline tlines pagenr left top right bottom code code2 '
+               'timcode timstart timname shiftx shifty\n')
+
+_agc_header = ('expname blocknr subjectnr imgfile pagenr code code2 ffdur ffqual ffbck ffin ffout rpdur rpqual rpcnt '
+               'rpsacc rpout tgdur tgqual tgcnt tgsacc tgout gdur gqual gcnt gsacc gbck gout\n')
+
+_ags_header = ('expname imgfile timfile blocknr subjectnr pagenr samplenr samstart event fixnr fixdur qual obtnr '
+               'oldobtnr code code2 timcode timstart timname\n')
+
+
+def imgfile_name(trial):
+    """Returns the imgfile of a trial, using the {cond+item}.BMP naming scheme"""
+    return '{}{:03d}.BMP'.format('ABCD'[trial % 4], trial)
+
+
+def generate_participant(folder, participant, trials, fixations, regions, samples, rng):
+    """This function writes the JNF, agc and ags file of one synthetic participant.
+
+    :param folder: The folder to write the files to
+    :param participant: The number of the participant
+    :param trials: The number of trials (imgfiles)
+    :param fixations: The number of fixations per trial
+    :param regions: The number of regions (codes) per trial
+    :param samples: The number of ags samples per trial
+    :param rng: The random.Random used to generate the values
+    :return:
+    """
+    name = os.path.join(folder, 'pp{:04d}'.format(participant))
+
+    with open(name + '.JNF', 'w') as f:
+        f.write(_jnf_header)
+        for trial in range(trials):
+            imgfile = imgfile_name(trial)
+            start = rng.randint(1000000, 9000000)
+            for fixation in range(fixations):
+                duration = rng.randint(-20, 900)
+                start += abs(duration) + rng.randint(20, 200)
+                f.write('TST {}  11 {} 0 {} {} {} {} {} {} {} {} 0 0 0 12 14 13 34 1 6 6 55 264 20 163 139 {} 25 0 0 '
+                        'irrelevant 0 0\n'.format(imgfile, participant, fixation, rng.randint(0, 1024),
+                                                  rng.randint(0, 768), start, duration, rng.randint(0, 300),
+                                                  rng.randint(0, 300), rng.choice([0, 0, 0, 1, 2]),
+                                                  rng.randint(1, regions)))
+
+    with open(name + '.agc', 'w') as f:
+        f.write(_agc_header)
+        for trial in range(trials):
+            for code in range(1, regions + 1):
+                f.write('TST 11 {} {} 55 {} 25 {}\n'.format(
+                    participant, imgfile_name(trial), code, ' '.join(str(rng.randint(0, 500)) for _ in range(21))))
+
+    with open(name + '.ags', 'w') as f:
+        f.write(_ags_header)
+        for trial in range(trials):
+            imgfile = imgfile_name(trial)
+            start = rng.randint(1000000, 9000000)
+            for sample in range(samples):
+                start += 2
+                f.write('TST {}  11 {} 0 {} {} F {} {} {} 3 151 {} 23 22 Hee \n'.format(
+                    imgfile, participant, sample, start, sample // 10, rng.randint(50, 900), rng.choice([0, 1, 3]),
+                    rng.randint(0, regions)))
+
+
+def generate_data(folder, participants, trials, fixations, regions, samples, seed=0):
+    """This function writes a folder of synthetic Fixation output.
+
+    :return: The folder
+    """
+    rng = random.Random(seed)
+    for participant in range(1, participants + 1):
+        generate_participant(folder, participant, trials, fixations, regions, samples, rng)
+
+    return folder
+
+
+"*** Benchmark ***"
+
+
+class Quiet(object):
+    """A stdout replacement that ignores everything, to keep the progress messages out of the timings"""
+
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def run_benchmark(data_folder, output_folder):
+    """This function times every stage of process_fixation_output.py on a folder of Fixation output.
+
+    :param data_folder: The folder containing the JNF, agc and ags files
+    :param output_folder: The folder to write the output to
+    :return: A dict with the total time, number of calls and number of rows for every stage
+    """
+    results = dict((stage, {'seconds': 0.0, 'calls': 0, 'rows': 0}) for stage in _stages)
+
+    def timed(stage, function, *args):
+        start = _timer()
+        result = function(*args)
+        results[stage]['seconds'] += _timer() - start
+        results[stage]['calls'] += 1
+        return result
+
+    context = p.RunContext(data_folder, output_folder, p.FixationConfig())
+    context.agc_present = True
+    context.ags_present = True
+
+    stdout = sys.stdout
+    sys.stdout = Quiet()
+    try:
+        for file in sorted(x for x in os.listdir(data_folder) if x.endswith('.JNF')):
+            jnf = os.path.join(data_folder, file)
+            short_filename = file[:-4]
+
+            lines = timed('sort_jnf_file', p.sort_jnf_file, jnf)
+            results['sort_jnf_file']['rows'] += len(lines)
+
+            trt = timed('make_trt', p.make_trt, lines)
+            results['make_trt']['rows'] += len(lines)
+
+            timed('make_trt_hashed', p.make_trt_hashed, jnf)
+            results['make_trt_hashed']['rows'] += len(lines)
+
+            if p.numpy is not None:
+                timed('make_trt_numpy', p.make_trt_numpy, jnf)
+                results['make_trt_numpy']['rows'] += len(lines)
+
+            act = timed('make_act', p.make_act, trt, os.path.join(data_folder, short_filename + '.agc'))
+            results['make_act']['rows'] += len(act)
+
+            context.act_files.append((short_filename, act))
+
+        timed('combine_act_files', p.combine_act_files, context)
+        results['combine_act_files']['rows'] = sum(len(act) for name, act in context.act_files)
+
+        timed('combine_ags_files', p.combine_ags_files, context)
+        for file in os.listdir(data_folder):
+            if file.endswith('.ags'):
+                with open(os.path.join(data_folder, file)) as f:
+                    results['combine_ags_files']['rows'] += sum(1 for line in f) - 1
+    finally:
+        sys.stdout = stdout
+
+    # Leave out the stages that weren't run, like the numpy engine without NumPy
+    return dict((stage, result) for stage, result in results.items() if result['calls'])
+
+
+def compare_results(results, baseline, tolerance):
+    """This function compares benchmark results with the results of a baseline.
+
+    :param results: The stage results of this benchmark
+    :param baseline: The stage results of the baseline
+    :param tolerance: How much slower a stage may be, as a fraction of the baseline time
+    :return: A list of the stages that got slower than allowed
+    """
+    regressions = []
+    for stage, result in sorted(results.items()):
+        if stage in baseline and result['seconds'] > baseline[stage]['seconds'] * (1 + tolerance):
+            regressions.append(stage)
+
+    return regressions
+
+
+def arg_parse():
+    """This function sets up the argument parser of the benchmark.
+
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='This benchmark times every stage of process_fixation_output.py on '
+                                                 'generated Fixation output.')
+    parser.add_argument('--participants', type=int, default=20, help='The number of participants. Defaults to 20.')
+    parser.add_argument('--trials', type=int, default=40, help='The number of trials per participant. Defaults to 40.')
+    parser.add_argument('--fixations', type=int, default=25, help='The number of fixations per trial. Defaults to 25.')
+    parser.add_argument('--regions', type=int, default=10, help='The number of regions per trial. Defaults to 10.')
+    parser.add_argument('--samples', type=int, default=1000, help='The number of ags samples per trial. '
+                                                                   'Defaults to 1000.')
+    parser.add_argument('--seed', type=int, default=0, help='The seed used to generate the data. Defaults to 0.')
+    parser.add_argument('--data', type=str, help='Keep the generated data in this folder, instead of a temporary one.')
+    parser.add_argument('--output', type=str, help='Write the results to this file, instead of the screen.')
+    parser.add_argument('--compare', type=str, help='A results file of an earlier benchmark. If a stage got slower '
+                                                    'than allowed by --tolerance, the benchmark fails.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='How much slower a stage may be than in the '
+                                                                     'compared results. Defaults to 0.2 (20%%).')
+
+    return parser.parse_args()
+
+
+def main():
+    """Generates the data, runs the benchmark and reports the results.
+
+    :return: The exit code: 0 if all went well, 1 if a stage got slower than the compared results
+    """
+    args = arg_parse()
+
+    temp_folder = tempfile.mkdtemp(prefix='fixation_benchmark_')
+    data_folder = args.data or os.path.join(temp_folder, 'data')
+    output_folder = os.path.join(temp_folder, 'output')
+    for folder in [data_folder, output_folder]:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+    try:
+        generate_data(data_folder, args.participants, args.trials, args.fixations, args.regions, args.samples,
+                      args.seed)
+        stages = run_benchmark(data_folder, output_folder)
+    finally:
+        shutil.rmtree(temp_folder)
+
+    results = {
+        'config': {'participants': args.participants, 'trials': args.trials, 'fixations': args.fixations,
+                   'regions': args.regions, 'samples': args.samples, 'seed': args.seed},
+        'python': platform.python_version(),
+        'numpy': getattr(p.numpy, '__version__', None),
+        'stages': stages,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    else:
+        print(json.dumps(results, indent=1, sort_keys=True))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(stages, json.load(f)['stages'], args.tolerance)
+        for stage in regressions:
+            print('{} got slower than allowed'.format(stage), file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+# Only run if this file is executed by itself
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,17 +12,156 @@ from __future__ import print_function
 import os
 import re
 import argparse
+import array
+import collections
+import cProfile
+import gzip
+import hashlib
 import inspect
+import io
+import itertools
+import json
+import locale
+import mmap
+import multiprocessing
+import pstats
 import sys
+import threading
+import time
+import traceback
+
+"*** Settings ***"
+
+
+class FixationConfig(object):
+    """The settings of a run of the script, or of a FixationProcessor.
+
+    A processor only uses engine, verbose, lenient and extra_metrics. The other settings are the command line options
+    of the script.
+
+    :param engine: The engine used to calculate the TRT, either 'python', 'hash' or 'numpy'. The numpy engine falls
+                   back to the python engine if NumPy isn't installed
+    :param verbose: If the progress should be printed, like the script does
+    :param lenient: If malformed rows should be left out and kept in the quarantine of the processor, instead of
+                    raising a FixationError
+    :param extra_metrics: If the saccade totals and the first and second pass durations should be added to the act rows
+    :param stream: If act rows should be written to allACTFiles.txt as soon as they are made instead of kept in memory
+    :param jobs: The number of processes used to process the participants, or the folders in batch mode. 0 means one
+                 for every CPU core
+    :param incremental: If only the files that changed since the previous run should be processed again
+    :param report: The format of the run report written to the output folder, either 'json', 'csv' or None for none
+    :param columnar: The format of the columnar copies of the combined files, either 'parquet', 'arrow' or None
+    :param compress: The compression used to write the combined files, either 'gzip', 'zstd' or None for none
+    :param pipeline: If reading, processing and writing should overlap, using threads
+    :param resume: If the participants finished by an interrupted run should not be processed again
+    :param ags_summary: If the samples and fixations of every region in the ags files should be summarized
+    :param profile: If the run should be profiled with cProfile, writing the profile to the output folder
+    :param trace_memory: If the memory allocations of the run should be traced, and reported in the output folder
+    """
+    __slots__ = ['engine', 'verbose', 'lenient', 'extra_metrics', 'stream', 'jobs', 'incremental', 'report',
+                 'columnar', 'compress', 'pipeline', 'resume', 'ags_summary', 'profile', 'trace_memory']
+
+    def __init__(self, engine='python', verbose=False, lenient=False, extra_metrics=False, stream=False, jobs=1,
+                 incremental=False, report=None, columnar=None, compress=None, pipeline=False, resume=False,
+                 ags_summary=False, profile=False, trace_memory=False):
+        self.engine = engine
+        self.verbose = verbose
+        self.lenient = lenient
+        self.extra_metrics = extra_metrics
+        self.stream = stream
+        self.jobs = jobs
+        self.incremental = incremental
+        self.report = report
+        self.columnar = columnar
+        self.compress = compress
+        self.pipeline = pipeline
+        self.resume = resume
+        self.ags_summary = ags_summary
+        self.profile = profile
+        self.trace_memory = trace_memory
+
+    # The settings are handed to the processes of a pool, and Python 2 can only pickle classes with __slots__ like this
+    def __getstate__(self):
+        return self.as_dict()
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def as_dict(self):
+        """Returns the settings as a dict, by name"""
+        return dict((x, getattr(self, x)) for x in self.__slots__)
+
+    def replace(self, **changes):
+        """Returns a copy of these settings, with the given settings changed"""
+        settings = self.as_dict()
+        settings.update(changes)
+        return FixationConfig(**settings)
+
+
+"*** Run context ***"
+
+
+class RunContext(object):
+    """The state of a run of the script on a result folder.
+
+    run() makes a new context for every run and hands it to every stage, instead of keeping this state in module
+    variables. This way multiple folders can be processed at the same time in different threads.
+
+    :param result_path: The folder containing the Fixation files
+    :param output_path: The folder to write the output to
+    :param config: The FixationConfig with the settings of the run
+    """
+
+    def __init__(self, result_path, output_path, config):
+        self.result_path = result_path
+        self.output_path = output_path
+        self.config = config
+        self.act_files = []  # This will contain all act data, used to generate the allACTFiles file
+        self.agc_present = False  # If the folder contains agc files, used to check if we should do certain steps
+        self.ags_present = False  # If the folder contains ags files, used to check if we should do certain steps
+        self.manifest = new_manifest()  # The manifest of this run, describing all read and written files
+        self.previous_manifest = new_manifest()  # The manifest of the previous run, used to check which files changed
+        self.journal = None  # The journal of this run, an open file
+        self.journal_entries = {}  # The participants finished by the interrupted run, read from its journal
+        self.records = []  # The records of every stage run in this run, used for the run report
+        self.imgfile_cache = ImgfileSplits()  # The imgfile cache of this run, shared by all combined files
+        self.ags_summaries = {}  # The AgsSummary of every ags file added to allAGSFiles.txt in this run, by path
+        self.memory_trace = None  # The MemoryTrace of this run, if its memory is traced
+
 
 "*** Variables ***"
-_result_path = ''  # Fixation result files folder.
-_output_path = ''  # The folder to which we should output, if none is supplied, the result folder will be used
-_act_files = []  # This will contain all act data, used to generate the allACTFiles file
-_agc_present = False  # If the folder contains agc files, used to check if we should do certain steps
-_ags_present = False  # If the folder contains ags files, used to check if we should do certain steps
+_result_path = ''  # The Fixation result files folder chosen by the user, when the script asks for it
+_manifest_filename = '.fixation_manifest.json'  # The file in the output folder describing the files of the last run
+_journal_filename = '.fixation_journal'  # The file in the output folder listing the participants finished in this run
+_pipeline_depth = 4  # The number of items (participants, chunks or writes) a pipeline stage may run ahead
+
 _safe_exit = True  # This is set to false in the tests cases, so that we don't need to press something to exit
 
+"*** File headers ***"
+
+# The header of a single act file
+_act_header = ["expname", "blocknr", "subjectnr", "imgfile", "pagenr", "code", "code2", "ffdur", "ffqual", "ffbck",
+               "ffin", "ffout", "rpdur", "rpqual", "rpcnt", "rpsacc", "rpout", "tgdur", "tgqual", "tgcnt",
+               "tgsacc", "tgout", "gdur", "gqual", "gcnt", "gsacc", "gbck", "gout", "totfixdur", "totfixcnt",
+               "NumFixQualNot0", "totfixQual0dur", "totfixQual0cnt"]
+
+# The columns added after the TRT values of the act files with --extra-metrics
+_extra_metric_columns = ["totsaccindur", "totsaccoutdur", "totsaccinQual0dur", "totsaccoutQual0dur", "firstpassdur",
+                         "secondpassdur"]
+
+# The header of allACTFiles.txt, in which imgfile is split into cond and item
+_all_act_header = ('expname blocknr subjectnr cond item pagenr code code2 ffdur ffqual ffbck ffin ffout rpdur rpqual '
+                   'rpcnt rpsacc rpout tgdur tgqual tgcnt tgsacc tgout gdur gqual gcnt gsacc gbck gout totfixdur '
+                   'totfixcnt NumFixQualNot0 totfixQual0dur totfixQual0cnt\n')
+
+# The header of allAGSFiles.txt, in which imgfile is split into cond and item
+_all_ags_header = ('expname cond item timfile blocknr subjectnr pagenr samplenr samstart event fixnr fixdur qual '
+                   'obtnr code code2 timcode timstart timname\n')
+
+# The header of allAGSSummary.txt, with a line for every region of every participant in the ags files
+_ags_summary_header = 'subjectnr cond item code samples totfixcnt totfixdur NumFixQualNot0\n'
+
 "*** Python 2/3 cross compatibility ***"
 
 try:
@@ -32,6 +171,47 @@ except NameError:
     # We catch that error here, and define raw_input with the Python 3 input function
     raw_input = input
 
+try:
+    import queue
+except ImportError:
+    # The queue module is called Queue in Python 2
+    import Queue as queue
+
+"*** Optional dependencies ***"
+
+try:
+    # NumPy is only needed for the numpy TRT engine
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    # PyArrow is only needed to write the combined files in a columnar format
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    # zstandard is only needed to read and write zstd compressed files, gzip is part of the standard library
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    # The resource module is used to get the peak memory usage for the run report, it's not available on Windows
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    # tracemalloc is only needed for --trace-memory, it's part of the standard library since Python 3.4
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
 "*** General helper functions ***"
 
 
@@ -85,6 +265,9 @@ For example: "D:/Users/123456/EXP/result" or "EXP/result"\n"""
     # Ask for the folder location
     folder = raw_input(input_message)
 
+    # The files in the folder could have changed since it was scanned before
+    forget_folder(folder)
+
     # Check if the folder exits
     if not os.path.isdir(folder):
         print('We couldn\'t find the specified directory.')
@@ -110,6 +293,25 @@ def format_folder_name(folder):
     return "(Currect Directory)" + folder[1:]
 
 
+def find_result_folders(root):
+    """This function finds all folders containing Fixation result files.
+
+    :param root: The folder to look in, including all its sub folders
+    :return: A list of the folders, sub folders sorted on their names
+    """
+    possible_paths = []
+
+    # Loop over all sub folders, scanning every folder once. Only the scans of result folders are kept for the next
+    # steps
+    for sub_folder, names in walk_folders(root):
+        # Check if this folder contains jnf and agc/ags files. If so, return the name of that folder
+        if check_if_valid_path(sub_folder, FolderScan(names)):
+            scan_folder(sub_folder, names)
+            possible_paths.append(sub_folder)
+
+    return possible_paths
+
+
 def autodetect_result_path():
     """This function tries to autodetect Fixation result folders and ask the user which one they want to use.
 
@@ -125,18 +327,7 @@ def autodetect_result_path():
     """
     global _result_path
 
-    # Get all sub folders
-    sub_folders = [(x[0], x[2]) for x in os.walk('.')]
-
-    possible_paths = []
-
-    # Loop over them
-    for sub_folder, files in sub_folders:
-        # Check if this folder contains jnf and agc/ags files. If so, return the name of that folder
-        if does_folder_contain_files('.jnf', None, files) and does_folder_contain_files('.agc', None, files):
-            possible_paths.append(sub_folder)
-        elif does_folder_contain_files('.ags', None, files):
-            possible_paths.append(sub_folder)
+    possible_paths = find_result_folders('.')
 
     # If there is one possible path
     if len(possible_paths) == 1:
@@ -181,15 +372,18 @@ def autodetect_result_path():
         ask_for_path()
 
 
-def check_if_valid_path(path):
+def check_if_valid_path(path, scan=None):
     """This function checks if a folder is a valid result directory
 
     :param path:
+    :param scan: The FolderScan of the folder, if it's already known (optional)
     :return: bool
     """
-    if does_folder_contain_files('.jnf', path) and does_folder_contain_files('.agc', path):
+    groups = (scan or scan_folder(path)).groups
+
+    if groups.get('.jnf') and groups.get('.agc'):
         return True
-    elif does_folder_contain_files('.ags', path):
+    elif groups.get('.ags'):
         return True
 
     return False
@@ -203,14 +397,14 @@ def does_folder_contain_files(file_extension, folder, files=None):
     :param files: You can give a list of files in this folder if you already have if (optional)
     :return: If the folder contains files with the specified file extension
     """
-    # Get all the files if they weren't given
+    # Use the scan of the folder if the files weren't given
     if files is None:
-        files = os.listdir(folder)
+        return bool(scan_folder(folder).groups.get(file_extension.lower()))
 
     # For every file in the specified directory
     for fname in files:
-        # If the file ends with the specified extension, return true
-        if fname.lower().endswith(file_extension.lower()):
+        # If the file ends with the specified extension, return true. Compressed files count as well
+        if strip_compression(fname).lower().endswith(file_extension.lower()):
             return True
 
     # Return false in the base case, as we should've already returned if there was a file with the right extension
@@ -242,6 +436,18 @@ def safe_exit(status_code=0):
     sys.exit(status_code)
 
 
+class FixationError(Exception):
+    """Raised when the Fixation files can't be processed, for example because of a badly formatted line.
+
+    The processing functions raise this instead of stopping the script, so that they can also be used as a library.
+    code is the exit code the script stops with, like the code of SystemExit.
+    """
+
+    def __init__(self, message, code):
+        Exception.__init__(self, message)
+        self.code = code
+
+
 def check_number_columns_in_row(row, expected_number, hard_fail):
     """This function checks if there are just as many columns in a row as expected.
 
@@ -250,7 +456,7 @@ def check_number_columns_in_row(row, expected_number, hard_fail):
 
     :param row: A list representing a row
     :param expected_number: The expected number of columns in the row
-    :param hard_fail: If the function should stop the script when it's found a misformed line
+    :param hard_fail: If the function should raise a FixationError when it's found a misformed line
     :return: None
     """
 
@@ -261,479 +467,3222 @@ def check_number_columns_in_row(row, expected_number, hard_fail):
         print("Misformatted line: {}".format(" ".join(row)))
         print("Detected {} colunns, expected {} columns".format(len(row), expected_number))
         if hard_fail:
-            safe_exit(4)
+            raise FixationError('Badly formatted line: {}'.format(' '.join(row)), 4)
         else:
             return False
 
     return True
 
 
-"*** Processing functions ***"
+def malformed_row_error(line, code):
+    """This function tells the user about a line with a column that should be a number, but isn't.
 
+    :param line: The line, as a string
+    :param code: The exit code of the problem, 4 for an agc file and 6 for a JNF file
+    :return: The FixationError to stop with
+    """
+    print()
+    print("Badly formatted line found in this file! Stopping.")
+    print("Please check if Fixation hasn't written anything weird to this file")
+    print("Misformatted line: {}".format(line))
+    print("A column that should contain a number doesn't, or is missing")
 
-def sort_jnf_file(file):
-    """This function sorts the entries in a JNF file
+    return FixationError('Badly formatted line: {}'.format(line), code)
 
-    This function loads a JNF files, and sorts it's contents on the imgfile and code fields, in ascending order.
-    It also ignores the column headers, so that we do not process it in any step.
 
-    :param file: The file to be read
-    :return: A list of lists. Every list in the list represents a line in the files, splitted into the file columns
-    """
-    # Open the specified file
-    with open(file) as f:
-        # Read all lines, remove any newline characters and split the line in columns. This also ignores the header line
-        lines = [x.replace('\r', '').replace('\n', '').split(' ') for x in f.readlines() if not x.startswith('expname')]
+"*** Folder scanning ***"
 
-        # Sort the line on the imgfile and code fields (columns 2 and 30)
-        lines = sorted(
-            lines,
-            key=lambda x: (x[1], int(x[29]))
-        )
+try:
+    from os import scandir
+except ImportError:
+    # os.scandir is only available since Python 3.5
+    scandir = None
 
-        return lines
+# The scans of the folders scanned so far, by absolute path. When it contains _max_folder_scans scans, it is emptied,
+# so that it can't grow without bounds
+_folder_scans = {}
+_max_folder_scans = 100
 
 
-def make_trt(lines):
-    """This function calculates the missing values from a JNF file.
+class FolderScan(object):
+    """The files in a folder, grouped by their extension.
 
-    :param lines: A list of lists representing the JNF file
-    :return: a dictionary with as key an combination of pla_name and last_code, with as value the TRT values in a list
+    Compressed files are grouped by the extension before the compression extension, so test1.ags.gz is one of the .ags
+    files. If a file exists both uncompressed and compressed, only the uncompressed file is in its group. Every group
+    is sorted on the filenames without compression extension.
     """
-    # Programmer's note: This is all magic!
+    __slots__ = ('names', 'groups')
 
-    # Define all used variables
-    last_pla_name       = None
-    last_code           = None
-    last_fixation       = None
-    last_sacc_in        = None
-    last_sacc_out       = None
-    last_ok_fixation    = None
-    last_ok_sacc_in     = None
-    last_ok_sacc_out    = None
-    lastqualtotfix      = None
-    lastnumbertotfixok  = None
-    lastnumbertotfix    = None
+    def __init__(self, names):
+        self.names = set(names)
+        self.groups = {}
 
-    # This dict will contain the TRT entries using a key based upon the pla_name and code fields
-    trt = {}
+        seen = set()
+        for stripped, name in sorted([(strip_compression(x), x) for x in names]):
+            if stripped not in seen:
+                seen.add(stripped)
+                self.groups.setdefault(os.path.splitext(stripped)[1].lower(), []).append(name)
 
-    # Loop over the lines
-    for line in lines:
-        # Check if the line is complete
-        check_number_columns_in_row(line, 36, False)
 
-        # Cast values to the right types and put them in more descriptive variable names.
-        fixation        = int(line[10])
-        pla_name        = line[1]
-        code            = int(line[29])
-        sacc_in         = int(line[11])
-        sacc_out        = int(line[12])
-        qual            = int(line[13])
+def list_folder(folder):
+    """This function lists a folder once, telling files and sub folders apart without extra calls where possible.
 
-        # Correct negative fixations to 0
-        if fixation < 0:
-            fixation    = 0
+    Like os.walk, sub folders that are symbolic links are left out.
 
-        # Default values
-        ok_fixation     = 0
-        ok_sacc_in      = 0
-        ok_sacc_out     = 0
-        qualtotfix      = 1
-        numbertotfix    = 1
-        numbertotfixok  = 0
+    :param folder: The folder to list
+    :return: The names of the files in the folder, and the paths of its sub folders
+    """
+    names = []
+    sub_folders = []
+
+    if scandir is None:
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if not os.path.isdir(path):
+                names.append(name)
+            elif not os.path.islink(path):
+                sub_folders.append(path)
+    else:
+        for entry in scandir(folder):
+            if not entry.is_dir():
+                names.append(entry.name)
+            elif not entry.is_symlink():
+                sub_folders.append(entry.path)
 
-        # If qual = 0, we need to change some of the values specified under 'default values'
-        if qual == 0:
-            ok_fixation         = fixation
-            ok_sacc_in          = sacc_in
-            ok_sacc_out         = sacc_out
-            qualtotfix          = 0
-            numbertotfixok      = 1
+    return names, sub_folders
 
-        # If this line belongs to the same group
-        if pla_name == last_pla_name and code == last_code:
-            # Add all values to the counters
-            last_fixation       = fixation          + last_fixation
-            last_sacc_in        = sacc_in           + last_sacc_in
-            last_sacc_out       = sacc_out          + last_sacc_out
 
-            last_ok_fixation    = ok_fixation       + last_ok_fixation
-            last_ok_sacc_in     = ok_sacc_in        + last_ok_sacc_in
-            last_ok_sacc_out    = ok_sacc_out       + last_ok_sacc_out
+def scan_folder(folder, names=None):
+    """This function scans the files in a folder, or returns the previous scan of that folder.
 
-            last_pla_name       = pla_name
-            last_code           = code
+    This way every stage can look at the files in a folder, without listing the folder again. Use forget_folder to scan
+    a folder again, when its files could have changed, or when the folder isn't needed anymore.
 
-            lastqualtotfix      = qualtotfix        + lastqualtotfix
-            lastnumbertotfixok  = numbertotfixok    + lastnumbertotfixok
-            lastnumbertotfix    = numbertotfix      + lastnumbertotfix
-        # Else it's a new group (or the first group)
-        else:
-            # If this is not the first group encountered
-            if last_pla_name is not None:
-                # Add the last group to the dict
-                trt[last_pla_name + str(last_code)] = [
-                        str(last_fixation),
-                        str(lastnumbertotfix),
-                        str(lastqualtotfix),
-                        str(last_ok_fixation),
-                        str(lastnumbertotfixok)
-                    ]
+    :param folder: The folder to scan
+    :param names: The names of the files in the folder, if they are already known (optional)
+    :return: A FolderScan of the folder
+    """
+    key = os.path.abspath(folder)
+    scan = _folder_scans.get(key)
 
-            # Initialize all counters with this line's value
-            last_pla_name       = pla_name
-            last_code           = code
-            last_fixation       = fixation
-            last_sacc_in        = sacc_in
-            last_sacc_out       = sacc_out
+    if scan is None:
+        scan = FolderScan(list_folder(folder)[0] if names is None else names)
 
-            if qual == 0:
-                last_ok_fixation    = fixation
-                last_ok_sacc_in     = sacc_in
-                last_ok_sacc_out    = sacc_out
-                lastqualtotfix      = 0
-                lastnumbertotfix    = 1
-                lastnumbertotfixok  = 1
-            else:
-                last_ok_fixation    = 0
-                last_ok_sacc_in     = 0
-                last_ok_sacc_out    = 0
-                lastqualtotfix      = 1
-                lastnumbertotfix    = 1
-                lastnumbertotfixok  = 0
+        if len(_folder_scans) >= _max_folder_scans:
+            _folder_scans.clear()
+        _folder_scans[key] = scan
 
-    # Add the last group to the dict
-    trt[last_pla_name + str(last_code)] = [
-            str(last_fixation),
-            str(lastnumbertotfix),
-            str(lastqualtotfix),
-            str(last_ok_fixation),
-            str(lastnumbertotfixok)
-        ]
+    return scan
 
-    return trt
 
+def forget_folder(folder):
+    """Forgets the scan of a folder, so that it's scanned again the next time it's needed"""
+    _folder_scans.pop(os.path.abspath(folder), None)
 
-def make_act(trt, agc):
-    """This function generates a act file for a given agc file and a given TRT dict.
 
-    :param trt: The TRT dict generated by make_trt(1).
-    :param agc: The location of the agc file
-    :return: A list of lists, containing strings. Which represents an act file.
+def walk_folders(root):
+    """This function goes over a folder and all its sub folders, like os.walk, but listing every folder only once.
+
+    :param root: The folder to start in
+    :return: A generator giving the path and the names of the files of every folder
     """
-    # This var stores the output while it's being created
-    act = []
+    try:
+        names, sub_folders = list_folder(root)
+    except OSError:
+        # Skip folders we can't read, like os.walk
+        return
 
-    # Open the actual file
-    with open(agc) as agc_file:
-        # Parse the lines to a list of row lists of columns
-        lines = [x.replace('\r', '').replace('\n', '').split(' ')
-                 for x in agc_file.readlines() if not x.startswith('expname')]
+    yield root, names
 
-        # For every line
-        for line in lines:
-            # Check if the line is complete
-            check_number_columns_in_row(line, 28, True)
+    for sub_folder in sorted(sub_folders):
+        for folder in walk_folders(sub_folder):
+            yield folder
 
-            # Generate the TRT dict key
-            key = line[3] + line[5]
 
-            # Check if the TRT has an entry for this line
-            if key in trt:
-                # If so, combine the agc line with the TRT line and store them in the output list
-                act.append(line + trt[key])
-            else:
-                # If not, complement the agc line with 5 zero's and store that in the output list
-                act.append(line + ['0', '0', '0', '0', '0'])
+"*** Compressed files ***"
 
-    # Return all lines in this new act file
-    return act
+# The extensions of the compressed files we can read, and the compression they use
+_compressions = {'.gz': 'gzip', '.zst': 'zstd'}
 
+# The extension used for every compression
+_compression_extensions = {'gzip': '.gz', 'zstd': '.zst'}
 
-def process_jnf_agc_files():
-    """This function processes all JNF and agc files.
+# The extensions of the compressed files, for str.endswith
+_compressed_suffixes = tuple(_compressions)
 
-    This function opens an JNF file, sorts it and calculates a trt for it. It then uses this generated TRT to create a
-    act file for the corresponding agc file.
-    :return: nothing!
-    """
 
-    # If there are no agc files, display a nice message and stop
-    if not _agc_present:
-        print('No agc files found, skipping this step')
-        print()
-        return
+def strip_compression(filename):
+    """Returns a filename without its compression extension, for example test1.ags for test1.ags.gz"""
+    if filename.lower().endswith(_compressed_suffixes):
+        return filename[:filename.rfind('.')]
 
-    # Get a sorted list of all JNF files in the result dir
-    files = sorted([x for x in os.listdir(_result_path) if x.lower().endswith('.jnf')])
+    return filename
 
-    # For every JNF file
-    for file in files:
-        # Removed the .JNF extension to get the filename
-        short_filename = file[:-4]
 
-        # Sort the lines in the file
-        print('Sorting {}'.format(short_filename))
-        sorted_lines = sort_jnf_file(os.path.join(_result_path, file))
+def list_files(folder, file_extension, scan=None):
+    """This function lists the files in a folder with a certain file extension, including compressed files.
 
-        # Calculate the TRT for this JNF using the sorted lines
-        print('Calculating TRT for {}'.format(short_filename))
-        trt = make_trt(sorted_lines)
+    If a file exists both uncompressed and compressed, only the uncompressed file is listed.
 
-        # Make the act file for the corresponding agc file
-        print('Making act for {}'.format(short_filename))
-        act = make_act(trt, os.path.join(_result_path, short_filename + '.agc'))
+    :param folder: The folder to list
+    :param file_extension: The required file extension, for example '.jnf'
+    :param scan: The FolderScan of the folder, if it's already known (optional)
+    :return: A list of filenames, sorted on their names without compression extension
+    """
+    return list((scan or scan_folder(folder)).groups.get(file_extension.lower(), []))
 
-        # Add this act file to the list of all act files
-        _act_files.append((short_filename, act))
 
-        # Add the headers to the act file. This is done after adding the act to the global _act_files so that the
-        # headers aren't in that variable. The script doesn't need them, but humans do in the written act file
-        act = [["expname", "blocknr", "subjectnr", "imgfile", "pagenr", "code", "code2", "ffdur", "ffqual", "ffbck",
-                "ffin", "ffout", "rpdur", "rpqual", "rpcnt", "rpsacc", "rpout", "tgdur", "tgqual", "tgcnt",
-                "tgsacc", "tgout", "gdur", "gqual", "gcnt", "gsacc", "gbck", "gout", "totfixdur", "totfixcnt",
-                "NumFixQualNot0", "totfixQual0dur", "totfixQual0cnt"]] + act
+def find_file(folder, filename, scan=None):
+    """Returns the path of a file in a folder, or of a compressed version of it if only that exists"""
+    names = (scan or scan_folder(folder)).names
+    if filename not in names:
+        for extension in sorted(_compressions):
+            if filename + extension in names:
+                return os.path.join(folder, filename + extension)
 
-        # Write the act file to an actual file on the filesysten
-        with open(os.path.join(_output_path, '{}.act'.format(short_filename)), 'w+') as f:
-            f.writelines([' '.join(x) + "\n" for x in act])
-            f.close()
+    return os.path.join(folder, filename)
 
-        # Print a separator line for output readability
-        print()
 
+def open_file(path, mode='r'):
+    """This function opens a file as text, decompressing or compressing it if its extension says so.
 
-def process_combined_file_lines(lines, imgfile_index, file):
-    """This function processes every supplied line and writes it to a supplied file
+    :param path: The file to open
+    :param mode: Either 'r' to read the file, or 'w' to write it
+    :return: A file IO object
+    """
+    compression = _compressions.get(os.path.splitext(path)[1].lower())
 
-    This function is used by both combine functions to write their lines to the combined file.
-    It also splits the imgfile column in two columns: cond and item. You need to specify the index
-    this column.
+    if compression is None:
+        data = read_ahead_data(path) if mode == 'r' else None
+        if data is not None:
+            return io.TextIOWrapper(io.BytesIO(data))
+        return open(path, mode)
 
-    :param lines: A list of lines to process
-    :param imgfile_index: The index on which the imgfile field lives
-    :param file: A file IO object to write to
-    :return: /dev/null
+    stream = open_compressed(path, compression, mode)
+
+    if mode == 'w':
+        return CompressedWriter(stream)
+
+    return io.TextIOWrapper(stream)
+
+
+def open_compressed(path, compression, mode='r'):
+    """This function opens a compressed file as a binary stream.
+
+    :param path: The file to open
+    :param compression: The compression of the file, either 'gzip' or 'zstd'
+    :param mode: Either 'r' to read the file, or 'w' to write it
+    :return: A file IO object that reads or writes the uncompressed bytes
     """
-    # For every line in this act
-    for line in lines:
-        # Create a list to hold the output in while processing
-        output_line = []
-        for i, value in enumerate(line):
-            # If this is the imgfile field, process it to get the cond and item fields
-            if i == imgfile_index:
-                # An image file is named using a naming scheme: {cond+item}.BMP.
-                # cond is a string of at least 1 characters
-                # item is an integer of at least 3 digits
-                # We use a regex to split these into a tuple
-                cond_item = re.findall(r'([a-zA-Z]+)([0-9]+)', value)
-
-                # Sanity check mostly to see if it's actually found something, should not error
-                if cond_item is not None and len(cond_item) == 1:
-                    # Get the cond and item out of the tuple
-                    cond, item = cond_item[0]
-
-                    # Add them to the output
-                    output_line.append(cond)
-                    output_line.append(item)
-                else:
-                    # But just in case, handle it
-                    print("Badly formatted line found in this file! Stopping!")
-                    print("Please check if Fixation hasn't written anything weird to this file")
-                    print("Misformatted line: {}".format(" ".join(line)))
-                    safe_exit(2)
-            else:
-                # Otherwise just straight add it to the output
-                output_line.append(value)
+    # Decompress the contents of the file if it was already read ahead
+    data = read_ahead_data(path) if mode == 'r' else None
 
-        # Write this line to the output file
-        file.write(" ".join(output_line))
-        file.write("\n")
+    if compression == 'zstd':
+        if zstandard is None:
+            print('zstandard is not installed, cannot open {}'.format(os.path.basename(path)))
+            raise FixationError('zstandard is not installed, cannot open {}'.format(path), 2)
+        stream = zstandard.open(path if data is None else io.BytesIO(data), mode + 'b')
+        return io.BufferedReader(stream) if mode == 'r' else stream
 
+    if data is not None:
+        return gzip.GzipFile(fileobj=io.BytesIO(data), mode='rb')
 
-def combine_act_files():
-    """This function combines all generated act files.
+    # A low compression level, as the combine steps would otherwise spend most of their time compressing
+    return gzip.GzipFile(path, mode + 'b', compresslevel=6)
 
-    This function takes all generated act files, and combines it into one master file.
-    It also replaces the imgfile field of every act file with an cond and item field.
 
-    These two fields are generated out of the imgfile field.
+class CompressedWriter(object):
+    """A file-like object that writes text to a compressed stream.
 
-    :return: Nada
+    tell() returns the number of uncompressed bytes written, like it would for an uncompressed file. Compressed
+    streams can't always tell their position themselves.
     """
 
-    # If there are no agc files, display a nice message and stop
-    if not _agc_present:
-        print('No agc files found, skipping this step')
-        print()
-        return
+    def __init__(self, stream):
+        self.stream = stream
+        self.position = 0
 
-    # open the output file
-    with open(os.path.join(_output_path, 'allACTFiles.txt'), 'w+') as f:
-        # Write the file headers, for clarity
-        print('Writing headers')
-        f.write('expname blocknr subjectnr cond item pagenr code code2 ffdur ffqual ffbck ffin ffout rpdur rpqual '
-                'rpcnt rpsacc rpout tgdur tgqual tgcnt tgsacc tgout gdur gqual gcnt gsacc gbck gout totfixdur '
-                'totfixcnt NumFixQualNot0 totfixQual0dur totfixQual0cnt\n')
-        print()
+    def write(self, text):
+        data = text.encode(_text_encoding)
+        self.stream.write(data)
+        self.position += len(data)
 
-        # Go over all the generated act files
-        for k, v in _act_files:
-            # Inform the user of what we are doing
-            print('Adding {}.act'.format(k))
+    def writelines(self, lines):
+        self.write(''.join(lines))
 
-            # Process the lines of this file
-            process_combined_file_lines(v, 3, f)
+    def tell(self):
+        return self.position
 
-        # Inform the user that we are done creating the combined file
-        print()
-        print('Created allActFiles.txt')
-        print()
+    def close(self):
+        self.stream.close()
 
+    def __enter__(self):
+        return self
 
-def combine_ags_files():
-    """This function combines all ags files
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-    This function takes all found ags files, and combines it into one master file.
-    It also replaces the imgfile field of every act file with an cond and item field.
 
-    These two fields are generated out of the imgfile field.
-    :return:
-    """
-    # Newline in output for clarity
-    print()
+def combined_file_path(context, filename):
+    """Returns the location of a combined file in the output folder of a run, with the extension of the used
+    compression"""
+    return os.path.join(context.output_path, filename + _compression_extensions.get(context.config.compress, ''))
 
-    # If there are no ags files, display a nice message and stop
-    if not _ags_present:
-        print('No ags files found, skipping this step')
-        return
 
-    # Get all files ending with ags, and sort them
-    files = sorted([x for x in os.listdir(_result_path) if x.lower().endswith('.ags')])
+"*** Memory-mapped reader ***"
 
-    # Open the output file
-    with open(os.path.join(_output_path, 'allAGSFiles.txt'), 'w+') as output_file:
-        # Write the file headers, for clarity
-        print('Writing headers')
-        output_file.write('expname cond item timfile blocknr subjectnr pagenr samplenr samstart event fixnr fixdur '
-                          'qual obtnr code code2 timcode timstart timname\n')
 
-        # Loop over every file and open that file
-        for file in files:
-            with open(os.path.join(_result_path, file)) as f:
-                # Inform the user of what we are doing
-                print('Adding {}'.format(file))
+def open_mapped(path):
+    """This function opens a file for reading its bytes.
 
-                # Load all lines in this file except for the header and split them into columns
-                lines = [x.replace('\r', '').replace('\n', '').split(' ')
-                         for x in f.readlines() if not x.startswith('expname')]
+    Uncompressed files are memory-mapped, so that they are read straight from the page cache instead of being copied
+    into memory first. Compressed files are decompressed while they are read. Files that were read ahead by the
+    pipeline for the participant processed by this thread are read from memory.
 
-                # Process the lines of this file
-                process_combined_file_lines(lines, 1, output_file)
+    :param path: The file to open
+    :return: An object with read(), readline() and close(), which returns bytes
+    """
+    compression = _compressions.get(os.path.splitext(path)[1].lower())
 
-        # Inform the user that we are done creating the file
-        print()
-        print('Created allAGSFiles.txt')
+    if compression is not None:
+        return open_compressed(path, compression)
 
+    data = read_ahead_data(path)
+    if data is not None:
+        return io.BytesIO(data)
 
-def arg_parse():
-    """This function sets up a basic argument parser.
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be memory-mapped
+            return io.BytesIO(b'')
 
-    It can be used to supply the result folder directly from the command line
 
-    :return:
-    """
-    parser = argparse.ArgumentParser(description='This script parses the standard output from Fixation. '
-                                                 'This adds extra information not given by the Fixation output '
-                                                 'and combines all act and all ags files in allACTFiles.txt and '
-                                                 'AllAgsFiles.txt.')
-    parser.add_argument('path', metavar='dir', nargs="?", type=str, help='The location of the folder containing the to '
-                                                                         'be processed files. If the folder is invalid '
-                                                                         'or omitted, it will be ignored.')
+# The encoding open() reads and writes text files with. The bytes read from the memory maps are decoded with it too,
+# so that the imgfile of a JNF file is the same string as the imgfile read from its agc file
+_text_encoding = locale.getpreferredencoding(False)
 
-    parser.add_argument('output', metavar='out', nargs="?", type=str, help='The location of the folder where the output'
-                                                                           ' should be stored. When not supplied, the '
-                                                                           'input dir will be used.')
+if bytes is str:
+    # Python 2 works with byte strings, so nothing needs to be decoded
+    def to_text(data):
+        return data[:]
+else:
+    def to_text(data):
+        """Decodes bytes to a string, in the encoding open() uses"""
+        return str(data, _text_encoding)
 
-    return parser.parse_args()
 
+def iter_lines(path):
+    """This function reads the lines of a file one by one as bytes, ignoring the column headers.
 
-"*** Main function ***"
+    :param path: The file to read
+    :return: A generator giving every line, including its newline characters
+    """
+    f = open_mapped(path)
+    try:
+        for line in iter(f.readline, b''):
+            if not line.startswith(b'expname'):
+                yield line
+    finally:
+        f.close()
 
-# These parameters are used in the testcases
-def main(result_path=None, output_path=None):
-    """Main function that starts all the magic.
 
-    It is called at the end of this file.
-    :return:
+def iter_rows(path):
+    """This function reads the rows of a file one by one, split into columns, ignoring the column headers.
+
+    :param path: The file to read
+    :return: A generator giving a list for every line in the file, split into the file columns
     """
-    # Use the global _result_path, so that all functions can use it
-    global _result_path
-    global _output_path
-    global _agc_present
-    global _ags_present
+    for line in iter_lines(path):
+        # Removing a carriage return doesn't copy the line if there isn't one
+        yield to_text(line).replace('\r', '').rstrip('\n').split(' ')
 
-    # Check if the paths were supplied
-    if result_path is None and output_path is None:
-        # Setup the argument parser
-        args = arg_parse()
 
-        # If a path is supplied through the arguments and is valid
-        if args.path is not None and check_if_valid_path(args.path):
-            _result_path = args.path
-        else:
-            # Otherwise, resolve the result path we need to use
-            print('-----  Trying to autodetect result folder(s) containing Fixation output files -----')
-            print()
-            autodetect_result_path()
+def read_rows(path):
+    """This function reads all rows of a file, split into columns, ignoring the column headers.
 
-        # If an output path is supplied through the arguments and is valid
-        if args.output is not None and check_path_writable_executable(args.output):
-            _output_path = args.output
-        else:
-            # Otherwise, default to the result path
-            _output_path = _result_path
-    else:
-        _result_path = result_path
-        _output_path = output_path
+    The lines are read from a memory map, so only the list of rows is kept in memory and not also a list of all lines
+    of the file.
+
+    :param path: The file to read
+    :return: A list of lists. Every list in the list represents a line in the file, split into the file columns
+    """
+    return list(iter_rows(path))
+
+
+def iter_columns(path, last_column):
+    """This function reads the rows of a file one by one, ignoring the column headers.
+
+    Every row is only split up to the last needed column, the rest of the row is left as one value. The values are
+    bytes, so that nothing is decoded that isn't used.
+
+    :param path: The file to read
+    :param last_column: The index of the last column that is needed
+    :return: A generator giving the number of columns and the split row (as bytes) of every line
+    """
+    for line in iter_lines(path):
+        # Remove any newline characters
+        line = line.rstrip(b'\n')
+        if b'\r' in line:
+            line = line.replace(b'\r', b'')
+
+        yield line.count(b' ') + 1, line.split(b' ', last_column + 1)
+
+
+"*** Pipeline ***"
+
+# The files read ahead by the pipeline for the participant a thread is processing, in the files attribute. They are
+# kept per thread, so that other threads, like those of a FixationProcessor, never read them
+_read_ahead = threading.local()
+
+
+def prefetch(iterable, depth):
+    """This generator goes over an iterable in a background thread, ahead of the code using it.
+
+    This way the work needed to get the next items, like reading a file, is done while the current item is being
+    processed. At most depth items are kept waiting, so that the background thread can't run too far ahead. If getting
+    an item raises an exception, the exception is raised again by this generator.
+
+    :param iterable: The iterable to go over
+    :param depth: The maximum number of items waiting to be used
+    :return: A generator giving the items of the iterable, in the same order
+    """
+    items = queue.Queue(depth)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item, error=None):
+        # Keep trying until there is room, unless the generator was stopped in the meantime
+        while not stopped.is_set():
+            try:
+                items.put((item, error), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as e:
+            put(done, e)
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+class BackgroundWriter(object):
+    """A file-like object that writes to another file in a background thread.
+
+    write() only queues the text, so that the next text can already be made while the previous text is being written.
+    At most _pipeline_depth writes are queued. tell() counts the characters written, which are bytes for the ASCII
+    Fixation output.
+    """
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.position = output_file.tell()
+        self.pending = queue.Queue(_pipeline_depth)
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            text = self.pending.get()
+            if text is None:
+                return
+
+            # After an error, the rest of the writes are ignored. The error is raised by the next write or close
+            if self.error is None:
+                try:
+                    self.output_file.write(text)
+                except BaseException as e:
+                    self.error = e
+
+    def write(self, text):
+        if self.error is not None:
+            raise self.error
+        self.pending.put(text)
+        self.position += len(text)
+
+    def writelines(self, lines):
+        self.write(''.join(lines))
+
+    def tell(self):
+        return self.position
+
+    def wait(self):
+        """Waits until all queued text is written"""
+        self.pending.put(None)
+        self.thread.join()
+
+    def close(self):
+        self.wait()
+        try:
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.output_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.wait()
+            self.output_file.__exit__(exc_type, exc_value, traceback)
+
+
+def read_ahead_data(path):
+    """Returns the contents of a file if the pipeline read it ahead for the participant this thread is processing,
+    otherwise None"""
+    return getattr(_read_ahead, 'files', {}).get(path)
+
+
+def read_participant_files(job):
+    """This function reads the JNF and agc file of a participant into memory, for process_prefetched_participant.
+
+    :param job: A tuple with the arguments for process_participant
+    :return: A tuple with the job and the contents of the files, by path
+    """
+    result_path, output_path, file = job[:3]
+    files = {}
+    for path in [os.path.join(result_path, file), find_file(result_path, strip_compression(file)[:-4] + '.agc')]:
+        with open(path, 'rb') as f:
+            files[path] = f.read()
+
+    return job, files
+
+
+def process_prefetched_participant(job_files, memory_trace=None):
+    """This function runs process_participant on the files read by read_participant_files.
+
+    The files are only read from memory by this thread, and only while it processes this participant. If the pipeline
+    stops early, the files read ahead for the next participants are simply dropped with it.
+
+    :param job_files: A tuple with the arguments for process_participant and the contents of the files, by path
+    :param memory_trace: The MemoryTrace of the run, if its memory is traced (optional)
+    :return: A tuple with the filename without extension, the act file, the stage records and the exit code (None)
+    """
+    job, files = job_files
+    _read_ahead.files = files
+    try:
+        return process_participant(*job, memory_trace=memory_trace) + (None,)
+    finally:
+        del _read_ahead.files
+
+
+"*** Run report functions ***"
+
+# Use the most precise timer available
+_timer = getattr(time, 'perf_counter', time.time)
+
+
+def peak_memory():
+    """This function returns the peak memory usage of this process.
+
+    :return: The peak memory usage in bytes, or None if it's not available on this platform
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports the peak in kilobytes, macOS in bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def stage_start():
+    """Returns the start of a stage, for record_stage: the value of _timer() and the peak memory usage of the process
+    when the stage started"""
+    return _timer(), peak_memory()
+
+
+def record_stage(records, stage, participant, start, memory_trace=None, **counts):
+    """This function adds a record of a finished stage to a list of records.
+
+    The peak memory usage of the process never goes down, so the memory used by a stage is recorded as how much it
+    raised that peak (peak_memory_growth). A stage that needs less memory than an earlier stage doesn't raise it. When
+    the memory is traced, the highest traced memory usage during the stage is recorded as well (traced_peak_memory).
+
+    :param records: The list to add the record to
+    :param stage: The name of the stage
+    :param participant: The participant or file the stage processed
+    :param start: The value of stage_start() when the stage started
+    :param memory_trace: The MemoryTrace of the run, if its memory is traced (optional)
+    :param counts: The rows_read, rows_written, bytes_read and bytes_written of the stage, if any
+    :return:
+    """
+    started, start_peak = start
+    peak = peak_memory()
+
+    record = {'stage': stage, 'participant': participant, 'seconds': _timer() - started, 'rows_read': 0,
+              'rows_written': 0, 'bytes_read': 0, 'bytes_written': 0,
+              'peak_memory_growth': None if peak is None else peak - start_peak, 'process_peak_memory': peak,
+              'traced_peak_memory': None}
+    record.update(counts)
+    records.append(record)
+
+    if memory_trace is not None:
+        record['traced_peak_memory'] = memory_trace.finish_stage(stage, participant)
+
+
+def write_report(path, report_format, context, started):
+    """This function writes the run report, describing every stage run for every participant.
+
+    The json report also contains the totals of every stage, and the settings of the run. The csv report only contains
+    the records.
+
+    :param path: The file to write the report to
+    :param report_format: Either 'json' or 'csv'
+    :param context: The RunContext of the run, with the records of all stages
+    :param started: The value of _timer() when the run started
+    :return:
+    """
+    records = context.records
+    columns = ['stage', 'participant', 'seconds', 'rows_read', 'rows_written', 'bytes_read', 'bytes_written',
+               'peak_memory_growth', 'process_peak_memory', 'traced_peak_memory']
+
+    if report_format == 'csv':
+        with open(path, 'w') as f:
+            f.write(','.join(columns) + '\n')
+            for record in records:
+                f.write(','.join('' if record[x] is None else str(record[x]) for x in columns) + '\n')
+        return
+
+    # Add up the records of every stage
+    totals = {}
+    for record in records:
+        total = totals.setdefault(record['stage'], {'seconds': 0.0, 'rows_read': 0, 'rows_written': 0,
+                                                    'bytes_read': 0, 'bytes_written': 0, 'peak_memory_growth': 0,
+                                                    'count': 0})
+        for column in ['seconds', 'rows_read', 'rows_written', 'bytes_read', 'bytes_written']:
+            total[column] += record[column]
+        total['peak_memory_growth'] += record['peak_memory_growth'] or 0
+        total['count'] += 1
+
+    report = {
+        'result_path': os.path.abspath(context.result_path),
+        'output_path': os.path.abspath(context.output_path),
+        'seconds': _timer() - started,
+        'process_peak_memory': peak_memory(),
+        'settings': dict((x, y) for x, y in context.config.as_dict().items() if x != 'verbose'),
+        'imgfile_cache': context.imgfile_cache.stats(),
+        'totals': totals,
+        'stages': records,
+    }
+
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+
+
+"*** Profiling functions ***"
+
+# The functions the time and memory in the profiling reports are attributed to. Depending on the engine, the TRT is
+# calculated by sort_jnf_file and make_trt, by make_trt_hashed or by make_trt_numpy. The ags files are mostly combined
+# by add_ags_file, which only hands malformed chunks to process_combined_file_lines
+_profiled_stages = ['sort_jnf_file', 'make_trt', 'make_trt_hashed', 'make_trt_numpy', 'make_act',
+                    'process_combined_file_lines', 'add_ags_file']
+
+_traced_frames = 25  # The number of frames tracemalloc keeps of every allocation, to find the stage it was made in
+
+
+class MemoryTrace(object):
+    """The traced memory of a run.
+
+    stage_memory is the highest traced memory usage of every stage, by stage. snapshot is the (stage, participant,
+    bytes, snapshot) of the stage after which the most memory was in use, or None.
+    """
+
+    def __init__(self):
+        self.stage_memory = collections.OrderedDict()
+        self.snapshot = None
+
+    def finish_stage(self, stage, participant):
+        """This function remembers the highest traced memory usage of a finished stage.
+
+        If more memory is in use after this stage than after any earlier stage, a snapshot of the allocations is taken
+        for the memory report. To keep this fast enough, a new snapshot is only taken if the memory usage grew by a
+        tenth.
+
+        :param stage: The name of the stage
+        :param participant: The participant or file the stage processed
+        :return: The highest traced memory usage of the stage
+        """
+        current, peak = tracemalloc.get_traced_memory()
+
+        # The peak is reset after every stage, so that it's the peak of this stage. Before Python 3.9 it can't be
+        # reset, so the memory in use after the stage is used instead
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            peak = current
+        self.stage_memory[stage] = max(self.stage_memory.get(stage, 0), peak)
+
+        if self.snapshot is None or current > self.snapshot[2] * 1.1:
+            self.snapshot = (stage, participant, current, tracemalloc.take_snapshot())
+
+        return peak
+
+
+def start_profiling(context):
+    """This function starts profiling and tracing the memory of a run, if asked for.
+
+    Only this process is profiled, and only the main thread of it. The memory of the background threads of the pipeline
+    is traced as well. tracemalloc traces the whole process, so only one run at a time should trace its memory.
+
+    :param context: The RunContext of the run. Its memory_trace is set when its memory is traced
+    :return: The running cProfile.Profile, or None if the run isn't profiled
+    """
+    config = context.config
+
+    if (config.profile or config.trace_memory) and (config.jobs != 1 or config.pipeline):
+        print()
+        print('Only the main process and thread are profiled, use --jobs 1 without --pipeline to profile every stage')
+
+    if config.trace_memory:
+        if tracemalloc is None:
+            print()
+            print('tracemalloc is not available in this version of Python, the memory is not traced')
+        else:
+            tracemalloc.start(_traced_frames)
+            context.memory_trace = MemoryTrace()
+
+    if not config.profile:
+        return None
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stage_function_lines():
+    """Returns the stage of every line of the functions in _profiled_stages, as a dict from line number to the name of
+    the function. These functions are all in this file"""
+    lines = {}
+    for name in _profiled_stages:
+        code = globals()[name].__code__
+        for line in range(code.co_firstlineno, code.co_firstlineno + len(inspect.getsourcelines(code)[0])):
+            lines[line] = name
+
+    return lines
+
+
+def write_profile(output_path, profiler):
+    """This function writes the profile of a run to fixation_profile.prof, and a summary to fixation_profile.txt.
+
+    The .prof file can be opened with pstats, snakeviz or any other tool that reads cProfile output. The summary lists
+    the time spent in every profiled stage, followed by the functions that took the most time.
+
+    :param output_path: The folder to write the profile to
+    :param profiler: The cProfile.Profile of the run
+    :return:
+    """
+    profiler.dump_stats(os.path.join(output_path, 'fixation_profile.prof'))
+
+    with open(os.path.join(output_path, 'fixation_profile.txt'), 'w') as f:
+        stats = pstats.Stats(profiler, stream=f)
+        filename = globals()[_profiled_stages[0]].__code__.co_filename
+
+        f.write('stage calls seconds own_seconds\n')
+        for name in _profiled_stages:
+            calls, seconds, own_seconds = 0, 0.0, 0.0
+            for (path, line, function), values in stats.stats.items():
+                if function == name and path == filename:
+                    calls, own_seconds, seconds = values[1], values[2], values[3]
+            f.write('{} {} {:.6f} {:.6f}\n'.format(name, calls, seconds, own_seconds))
+
+        f.write('\n')
+        stats.sort_stats('cumulative').print_stats(30)
+
+    print('Created fixation_profile.prof and fixation_profile.txt')
+
+
+def write_memory_report(output_path, memory_trace):
+    """This function writes the traced memory of a run to fixation_memory.txt.
+
+    The report lists the highest traced memory usage of every stage. For the stage after which the most memory was in
+    use, it also lists the memory allocated in every profiled stage that was still in use, and the lines of code that
+    allocated the most of that memory. An allocation is attributed to a stage if it was made inside the function of
+    that stage, or inside a function called by it.
+
+    :param output_path: The folder to write the report to
+    :param memory_trace: The MemoryTrace of the run
+    :return:
+    """
+    with open(os.path.join(output_path, 'fixation_memory.txt'), 'w') as f:
+        f.write('stage peak_bytes\n')
+        for stage, peak in memory_trace.stage_memory.items():
+            f.write('{} {}\n'.format(stage, peak))
+
+        if memory_trace.snapshot is not None:
+            stage, participant, in_use, snapshot = memory_trace.snapshot
+            f.write('\nIn use after {} of {}: {} bytes\n'.format(stage, participant, in_use))
+
+            # Leave out the memory used by tracemalloc itself
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+            # Add up the allocations made by every profiled stage, using the frames of this file in their tracebacks
+            filename = globals()[_profiled_stages[0]].__code__.co_filename
+            stage_lines = stage_function_lines()
+            sizes = collections.OrderedDict((name, 0) for name in _profiled_stages)
+            for trace in snapshot.traces:
+                for name in set(stage_lines.get(frame.lineno) for frame in trace.traceback
+                                if frame.filename == filename):
+                    if name is not None:
+                        sizes[name] += trace.size
+
+            f.write('\nstage bytes\n')
+            for name, size in sizes.items():
+                f.write('{} {}\n'.format(name, size))
+
+            f.write('\nTop allocations\n')
+            for statistic in snapshot.statistics('lineno')[:30]:
+                f.write('{}\n'.format(statistic))
+
+    print('Created fixation_memory.txt')
+
+
+def finish_profiling(context, profiler):
+    """This function stops profiling and tracing the memory of a run, and writes their reports to its output folder.
+
+    :param context: The RunContext of the run
+    :param profiler: The cProfile.Profile returned by start_profiling, or None
+    :return:
+    """
+    if profiler is not None:
+        profiler.disable()
+        write_profile(context.output_path, profiler)
+
+    if context.memory_trace is not None:
+        tracemalloc.stop()
+        write_memory_report(context.output_path, context.memory_trace)
+        context.memory_trace = None
+
+
+"*** Quarantine ***"
+
+
+def quarantine_row(quarantine, row_number, line, reason):
+    """This function adds a malformed row to a quarantine list, which is done instead of stopping in lenient mode.
+
+    :param quarantine: The list of quarantined rows of a file
+    :param row_number: The number of the row in the file, not counting the column headers
+    :param line: The row as a string
+    :param reason: Why the row was quarantined
+    :return:
+    """
+    quarantine.append((row_number, reason, line))
+
+
+def write_quarantine(output_path, file, quarantine, records=None, memory_trace=None):
+    """This function writes the quarantine report of a file, listing the malformed rows that were skipped.
+
+    The report is a tab separated file named after the file, for example test1.agc.quarantine.txt, with the line
+    number, the reason and the line itself for every quarantined row.
+
+    :param output_path: The folder to write the report to
+    :param file: The path of the file the rows came from
+    :param quarantine: The list of quarantined rows of the file
+    :param records: A list to add the record of this stage to, for the run report (optional)
+    :param memory_trace: The MemoryTrace of the run, if its memory is traced (optional)
+    :return: The path of the report
+    """
+    start = stage_start()
+
+    # The row numbers don't count the column headers, but line numbers are easier to look up
+    with open_file(file) as f:
+        header_lines = 1 if f.readline().startswith('expname') else 0
+
+    name = os.path.basename(strip_compression(file))
+    path = os.path.join(output_path, name + '.quarantine.txt')
+    with open(path, 'w') as f:
+        f.write('line\treason\ttext\n')
+        for row_number, reason, line in quarantine:
+            f.write('{}\t{}\t{}\n'.format(row_number + header_lines, reason, line))
+
+    print('Quarantined {} malformed lines of {}, see {}'.format(len(quarantine), name, os.path.basename(path)))
+
+    if records is not None:
+        record_stage(records, 'quarantine', name, start, memory_trace, rows_written=len(quarantine),
+                     bytes_written=os.path.getsize(path))
+
+    return path
+
+
+"*** Incremental processing functions ***"
+
+
+def new_manifest():
+    """This function creates an empty manifest.
+
+    A manifest describes all files read and written in a run, so that the next run can check which files changed.
+
+    :return: An empty manifest dict
+    """
+    return {'version': 1, 'participants': {}, 'ags': {}, 'combined': {}}
+
+
+def load_manifest(folder):
+    """This function loads the manifest of the previous run from a folder.
+
+    :param folder: The folder containing the manifest
+    :return: The manifest, or an empty manifest if there is no (usable) manifest in the folder
+    """
+    try:
+        with open(os.path.join(folder, _manifest_filename)) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return new_manifest()
+
+    # Ignore manifests written by a different version of this script
+    if not isinstance(manifest, dict) or manifest.get('version') != 1:
+        return new_manifest()
+
+    return manifest
+
+
+def save_manifest(folder, manifest):
+    """This function saves a manifest to a folder.
+
+    :param folder: The folder to save the manifest to
+    :param manifest: The manifest to save
+    :return:
+    """
+    path = os.path.join(folder, _manifest_filename)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    replace_file(path + '.tmp', path)
+
+
+def replace_file(source, destination):
+    """This function moves a file to a destination, replacing the destination if it already exists.
+
+    :param source: The file to move
+    :param destination: The location to move it to
+    :return:
+    """
+    # Python 2 doesn't have os.replace, and os.rename can't replace files on Windows
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    else:
+        if os.path.exists(destination):
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+def hash_file(path):
+    """This function calculates the SHA-1 hash of the contents of a file.
+
+    :param path: The file to hash
+    :return: The hash as a hexadecimal string
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(chunk)
+
+    return sha1.hexdigest()
+
+
+def file_signature(path, previous=None, with_hash=True):
+    """This function describes a file using its size, modification time and (optionally) the hash of its contents.
+
+    Hashing a file means reading it completely. So if the file has the same size and modification time as in the
+    previous signature, we assume it didn't change and return the previous signature instead.
+
+    :param path: The file to describe
+    :param previous: The signature of this file in the previous run (optional)
+    :param with_hash: If the hash of the contents should be part of the signature
+    :return: A dict with the size, mtime and hash of the file, or None if the file doesn't exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    if previous is not None and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+        return previous
+
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': hash_file(path) if with_hash else None}
+
+
+def same_content(signature, previous):
+    """This function checks if two signatures describe the same file contents.
+
+    :param signature: The current signature of a file
+    :param previous: The signature of that file in the previous run
+    :return: If both signatures exist and describe the same contents
+    """
+    if signature is None or previous is None:
+        return False
+
+    if signature['hash'] is not None and previous['hash'] is not None:
+        return signature['hash'] == previous['hash']
+
+    return signature['size'] == previous['size'] and signature['mtime'] == previous['mtime']
+
+
+def participant_paths(context, file):
+    """Returns the paths of the JNF, agc and act file of a participant, by 'jnf', 'agc' and 'act'
+
+    :param context: The RunContext of the run
+    :param file: The filename of the JNF file
+    :return: A dict with the paths
+    """
+    short_filename = strip_compression(file)[:-4]
+    return {'jnf': os.path.join(context.result_path, file),
+            'agc': find_file(context.result_path, short_filename + '.agc'),
+            'act': os.path.join(context.output_path, short_filename + '.act')}
+
+
+def open_journal(folder, resume):
+    """This function opens the journal of this run, to which every finished participant is added.
+
+    :param folder: The output folder
+    :param resume: If the journal of the interrupted run should be continued, instead of starting a new one
+    :return: A file IO object of the journal
+    """
+    return open(os.path.join(folder, _journal_filename), 'a' if resume else 'w')
+
+
+def load_journal(folder):
+    """This function loads the participants finished by an interrupted run from its journal.
+
+    :param folder: The output folder
+    :return: A dict from the filename without extension of every finished participant to the signatures of its JNF,
+             agc and act file
+    """
+    entries = {}
+    try:
+        with open(os.path.join(folder, _journal_filename)) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line can be incomplete if the run was stopped while writing it
+                    continue
+                entries[entry['participant']] = entry['files']
+    except (IOError, OSError):
+        pass
+
+    return entries
+
+
+def journal_participant(context, short_filename, signatures):
+    """This function adds a finished participant to the journal of a run.
+
+    The journal is flushed to disk right away, so that the participant is not processed again when the run is resumed
+    after a crash.
+
+    :param context: The RunContext of the run
+    :param short_filename: The filename of the participant without extension
+    :param signatures: The signatures of the JNF, agc and act file of the participant, by 'jnf', 'agc' and 'act'
+    :return:
+    """
+    context.journal.write(json.dumps({'participant': short_filename, 'files': signatures}, sort_keys=True) + '\n')
+    context.journal.flush()
+    os.fsync(context.journal.fileno())
+
+
+def check_resumed_participant(context, file):
+    """This function checks if a participant was finished by the interrupted run, and didn't change since.
+
+    :param context: The RunContext of the run
+    :param file: The filename of the JNF file
+    :return: True if the act file of the participant can be used as it is
+    """
+    entry = context.journal_entries.get(strip_compression(file)[:-4])
+    if entry is None:
+        return False
+
+    paths = participant_paths(context, file)
+    return all(same_content(file_signature(path, entry.get(x), False), entry.get(x)) for x, path in paths.items()) \
+        and act_file_matches(paths['act'], context.config.extra_metrics)
+
+
+def act_file_matches(file, extra_metrics):
+    """This function checks if an act file written by an earlier run has the columns of this run, as the earlier run
+    could have been run with or without --extra-metrics.
+
+    :param file: The act file
+    :param extra_metrics: If this run adds the extra metrics to the act files
+    :return: True if the header of the act file is the header this run would write
+    """
+    try:
+        with open(file) as f:
+            return f.readline() == ' '.join(act_header(extra_metrics)) + '\n'
+    except (IOError, OSError):
+        return False
+
+
+def check_participant(context, file):
+    """This function checks if a participant changed since the previous run.
+
+    A participant changed if its JNF or agc file changed, or if its act file was changed or removed. The signatures of
+    these files are added to the manifest of the run.
+
+    :param context: The RunContext of the run
+    :param file: The filename of the JNF file
+    :return: True if the participant didn't change, and doesn't need to be processed again
+    """
+    # Removed the .JNF (and compression) extension to get the filename
+    short_filename = strip_compression(file)[:-4]
+    previous = context.previous_manifest['participants'].get(short_filename, {})
+
+    paths = participant_paths(context, file)
+    entry = dict((x, file_signature(path, previous.get(x))) for x, path in paths.items())
+    context.manifest['participants'][short_filename] = entry
+
+    return all(same_content(entry[x], previous.get(x)) for x in ('jnf', 'agc', 'act')) and \
+        act_file_matches(paths['act'], context.config.extra_metrics)
+
+
+def write_combined_file(context, filename, header, pieces):
+    """This function writes a combined file out of pieces, reusing the pieces of the previous run where possible.
+
+    Every piece is the part of the combined file made from one file. If that file didn't change since the previous run,
+    its lines are copied from the previous combined file instead of being processed again. If none of the pieces
+    changed, the previous combined file is kept as it is.
+
+    :param context: The RunContext of the run
+    :param filename: The filename of the combined file
+    :param header: The header line of the combined file
+    :param pieces: A list with a (name, signature, write) tuple for every piece, in order. write is a function that
+                   writes the lines of the piece to a given file and returns the number of lines it wrote
+    :return:
+    """
+    path = combined_file_path(context, filename)
+    previous = context.previous_manifest['combined'].get(filename)
+
+    # We can only reuse the previous combined file if it wasn't changed after the previous run
+    old_pieces = []
+    if previous is not None and same_content(file_signature(path, previous['file'], False), previous['file']):
+        old_pieces = previous['pieces']
+
+    # If none of the pieces changed, we can keep the previous combined file (and its columnar copy)
+    if old_pieces and [[name, signature['hash']] for name, signature, write in pieces] == \
+            [[name, content_hash] for name, content_hash, lines in old_pieces] and \
+            (context.config.columnar is None or os.path.exists(columnar_file_path(context, filename))):
+        print('{} has not changed, keeping it'.format(filename))
+        context.manifest['combined'][filename] = previous
+        return
+
+    # Remember where every piece starts in the previous combined file
+    old_starts = {}
+    start = 0
+    for name, content_hash, lines in old_pieces:
+        old_starts[name] = (content_hash, start, lines)
+        start += lines
+
+    old_file = open_file(path) if old_pieces else None
+
+    # The temporary file keeps the extension of the combined file, so that it's compressed in the same way
+    root, extension = os.path.splitext(path)
+    tmp_path = root + '.tmp' + extension
+    old_position = 0  # The line in the previous combined file we are at, not counting the header
+    new_pieces = []
+
+    try:
+        # Write to a temporary file first, as we are still reading the previous combined file
+        with open_combined_file(context, filename, tmp_path) as f:
+            f.write(header)
+            if old_file is not None:
+                old_file.readline()
+
+            for name, signature, write in pieces:
+                old = old_starts.get(name)
+
+                # Copy the lines of this piece if it didn't change, and we didn't already pass it in the previous file
+                if old is not None and old[0] == signature['hash'] and old[1] >= old_position:
+                    print('Reusing {}'.format(name))
+                    start = stage_start()
+                    position = f.tell()
+                    collections.deque(itertools.islice(old_file, old[1] - old_position), maxlen=0)
+                    f.writelines(itertools.islice(old_file, old[2]))
+                    old_position = old[1] + old[2]
+                    lines = old[2]
+                    record_stage(context.records, 'copy_unchanged', name, start, context.memory_trace,
+                                 rows_read=lines, rows_written=lines, bytes_written=f.tell() - position)
+                else:
+                    lines = write(f)
+
+                new_pieces.append([name, signature['hash'], lines])
+    finally:
+        if old_file is not None:
+            old_file.close()
+
+    replace_file(tmp_path, path)
+    context.manifest['combined'][filename] = {'file': file_signature(path, None, False), 'pieces': new_pieces}
+
+    # Inform the user that we are done creating the combined file
+    print()
+    print('Created {}'.format(filename))
+
+
+"*** Imgfile cache ***"
+
+# An image file is named using a naming scheme: {cond+item}.BMP.
+# cond is a string of at least 1 characters
+# item is an integer of at least 3 digits
+# We use this regex to split these into a tuple
+_imgfile_pattern = re.compile(r'([a-zA-Z]+)([0-9]+)')
+
+
+class ImgfileSplits(dict):
+    """A dict from imgfile values to their cond and item columns, used by both combine functions.
+
+    A study only has a few different imgfile values, so the cond and item of an imgfile are only calculated the first
+    time they are looked up. The value is the cond and item separated by a space, or None if the imgfile isn't named
+    using the naming scheme. When the dict contains max_size imgfiles, it is emptied, so that it can't grow without
+    bounds.
+
+    The number of lookups has to be counted by the user of this dict, as counting every lookup here would make it a lot
+    slower. The misses are counted here.
+    """
+
+    def __init__(self, max_size=10000):
+        dict.__init__(self)
+        self.max_size = max_size
+        self.lookups = 0
+        self.misses = 0
+
+    def __missing__(self, imgfile):
+        self.misses += 1
+
+        cond_item = _imgfile_pattern.findall(imgfile)
+        split = ' '.join(cond_item[0]) if len(cond_item) == 1 else None
+
+        if len(self) >= self.max_size:
+            self.clear()
+        self[imgfile] = split
+
+        return split
+
+    def stats(self):
+        """Returns the number of lookups, hits and misses, so that they can be logged"""
+        return {'lookups': self.lookups, 'hits': self.lookups - self.misses, 'misses': self.misses}
+
+
+
+"*** Columnar output ***"
+
+# The columns of allACTFiles.txt stored as strings in the columnar output, all other columns are stored as integers.
+# item is a string, so that it keeps its leading zeros
+_act_string_columns = ['expname', 'cond', 'item']
+
+# The columns of allAGSFiles.txt. These are listed here, as the header of allAGSFiles.txt doesn't list oldobtnr
+_ags_columns = ['expname', 'cond', 'item', 'timfile', 'blocknr', 'subjectnr', 'pagenr', 'samplenr', 'samstart', 'event',
+                'fixnr', 'fixdur', 'qual', 'obtnr', 'oldobtnr', 'code', 'code2', 'timcode', 'timstart', 'timname']
+
+# The columns of allAGSFiles.txt stored as integers in the columnar output, all other columns are stored as strings
+_ags_int_columns = ['blocknr', 'subjectnr', 'pagenr', 'samplenr', 'samstart', 'fixnr', 'fixdur', 'qual', 'obtnr',
+                    'oldobtnr', 'code', 'code2']
+
+# The amount of text collected before it is converted to columns and written
+_columnar_chunk_size = 16 * 1024 * 1024
+
+
+class ColumnarTee(object):
+    """A file-like object that writes the lines of a combined file to a text file and a columnar file at the same time.
+
+    Everything written to it is written to the text file straight away. It is also collected, and converted to typed
+    columns in large chunks by the PyArrow csv reader. The first line is the header, which is not converted.
+    """
+
+    def __init__(self, text_file, path, columns, int_columns, file_format):
+        self.text_file = text_file
+        self.columns = columns
+        self.schema = pyarrow.schema([(x, pyarrow.int64() if x in int_columns else pyarrow.string()) for x in columns])
+        self.buffer = []
+        self.buffered = 0
+        self.header_skipped = False
+
+        if file_format == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write(self, text):
+        self.text_file.write(text)
+        self.buffer.append(text)
+        self.buffered += len(text)
+
+        if self.buffered >= _columnar_chunk_size:
+            self.write_columns()
+
+    def writelines(self, lines):
+        self.write(''.join(lines))
+
+    def tell(self):
+        return self.text_file.tell()
+
+    def write_columns(self, final=False):
+        """Converts the collected complete lines to columns and writes them to the columnar file"""
+        text = ''.join(self.buffer)
+
+        # Keep an incomplete last line for the next time, unless this is the last time
+        end = len(text) if final else text.rfind('\n') + 1
+        self.buffer = [text[end:]]
+        self.buffered = len(self.buffer[0])
+        text = text[:end]
+
+        if not self.header_skipped:
+            if '\n' not in text:
+                self.buffer.insert(0, text)
+                self.buffered += len(text)
+                return
+            text = text[text.index('\n') + 1:]
+            self.header_skipped = True
+
+        if not text.strip('\n'):
+            return
+
+        table = pyarrow.csv.read_csv(
+            io.BytesIO(text.encode('utf-8')),
+            read_options=pyarrow.csv.ReadOptions(column_names=self.columns),
+            parse_options=pyarrow.csv.ParseOptions(delimiter=' ', quote_char=False),
+            convert_options=pyarrow.csv.ConvertOptions(column_types=self.schema, strings_can_be_null=False))
+        self.writer.write_table(table)
+
+    def close(self):
+        try:
+            self.write_columns(True)
+        finally:
+            self.writer.close()
+            self.text_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't convert anything else if we are stopping because of an error
+            self.writer.close()
+            self.text_file.close()
+
+
+def open_combined_file(context, filename, path=None):
+    """This function opens a combined file of a run for writing.
+
+    If columnar output is enabled, everything written to the combined file is also written to a columnar file with
+    the same name in the output folder, for example allAGSFiles.parquet.
+
+    :param context: The RunContext of the run
+    :param filename: The filename of the combined file, allACTFiles.txt, allAGSFiles.txt or allAGSSummary.txt
+    :param path: The location to write the text file to, if it's not the combined file in the output folder
+    :return: A file IO object to write the combined file to
+    """
+    config = context.config
+    output_file = open_file(path or combined_file_path(context, filename), 'w')
+
+    if config.columnar is not None:
+        columnar_path = columnar_file_path(context, filename)
+        if filename == 'allACTFiles.txt':
+            columns = all_act_header(config.extra_metrics).split()
+            output_file = ColumnarTee(output_file, columnar_path, columns,
+                                      [x for x in columns if x not in _act_string_columns], config.columnar)
+        elif filename == 'allAGSSummary.txt':
+            columns = _ags_summary_header.split()
+            output_file = ColumnarTee(output_file, columnar_path, columns,
+                                      [x for x in columns if x not in ['cond', 'item']], config.columnar)
+        else:
+            output_file = ColumnarTee(output_file, columnar_path, _ags_columns, _ags_int_columns, config.columnar)
+
+    # When the pipeline is enabled, the file is written in a background thread
+    if config.pipeline:
+        output_file = BackgroundWriter(output_file)
+
+    return output_file
+
+
+def columnar_file_path(context, filename):
+    """Returns the location of the columnar copy of a combined file in the output folder of a run"""
+    return os.path.join(context.output_path, os.path.splitext(filename)[0] + '.' + context.config.columnar)
+
+
+"*** JNF row store ***"
+
+
+class JnfRows(object):
+    """The columns of a JNF file needed to calculate the TRT, stored compactly.
+
+    Instead of keeping every row as a list of 36 strings, only the imgfile, code, fixdur, SaccInDur, SaccOutDur and
+    Qual columns are kept. The numbers are stored as machine integers in arrays, and every imgfile value is only stored
+    once, as a study only has a few different imgfiles.
+
+    Iterating over it gives a (imgfile, code, fixdur, sacc_in, sacc_out, qual) tuple for every row.
+
+    For the extra metrics, first_passes can also keep for every row if it is part of the first pass of its region. As
+    this depends on the order of the file, it's set by read_jnf_rows before the rows are sorted.
+    """
+    __slots__ = ('imgfiles', 'codes', 'fixdurs', 'sacc_ins', 'sacc_outs', 'quals', 'first_passes', 'names')
+
+    def __init__(self):
+        self.imgfiles = []
+        self.codes = array.array('l')
+        self.fixdurs = array.array('l')
+        self.sacc_ins = array.array('l')
+        self.sacc_outs = array.array('l')
+        self.quals = array.array('l')
+        self.first_passes = array.array('b')
+
+        # Used to store every imgfile value only once
+        self.names = {}
+
+    def append(self, imgfile, code, fixdur, sacc_in, sacc_out, qual):
+        self.imgfiles.append(self.names.setdefault(imgfile, imgfile))
+        self.codes.append(code)
+        self.fixdurs.append(fixdur)
+        self.sacc_ins.append(sacc_in)
+        self.sacc_outs.append(sacc_out)
+        self.quals.append(qual)
+
+    def sorted(self):
+        """Returns a copy of these rows, sorted on the imgfile and code columns in ascending order"""
+        imgfiles = self.imgfiles
+        codes = self.codes
+        order = sorted(range(len(imgfiles)), key=lambda i: (imgfiles[i], codes[i]))
+
+        rows = JnfRows()
+        rows.names = self.names
+        rows.imgfiles = [imgfiles[i] for i in order]
+        for column in ('codes', 'fixdurs', 'sacc_ins', 'sacc_outs', 'quals'):
+            values = getattr(self, column)
+            setattr(rows, column, array.array('l', [values[i] for i in order]))
+
+        if self.first_passes:
+            first_passes = self.first_passes
+            rows.first_passes = array.array('b', [first_passes[i] for i in order])
+
+        return rows
+
+    def __len__(self):
+        return len(self.imgfiles)
+
+    def __iter__(self):
+        return zip(self.imgfiles, self.codes, self.fixdurs, self.sacc_ins, self.sacc_outs, self.quals)
+
+    def with_first_passes(self):
+        """Iterates over the rows like iterating over the JnfRows, with if the row is part of the first pass of its
+        region added to every tuple. If first_passes wasn't set, every row counts as a first pass."""
+        return zip(self.imgfiles, self.codes, self.fixdurs, self.sacc_ins, self.sacc_outs, self.quals,
+                   self.first_passes or itertools.repeat(1))
+
+
+def read_jnf_rows(file, quarantine=None, extended=False):
+    """This function reads the columns needed to calculate the TRT from a JNF file.
+
+    :param file: The JNF file to be read
+    :param quarantine: A list to add malformed rows to instead of using them, in lenient mode (optional)
+    :param extended: If the first passes needed for the extra metrics should be kept as well
+    :return: A JnfRows with every row of the file, in the order of the file
+    """
+    rows = JnfRows()
+    append = rows.append
+
+    # The regions of which the first pass has ended, and the region of the last row
+    passed = set()
+    last_key = None
+    first_pass = 1
+
+    # Only split the lines up to the code column
+    for row_number, (number_of_columns, line) in enumerate(iter_columns(file, 29), 1):
+        # Check if the line is complete
+        if number_of_columns != 36:
+            if quarantine is not None:
+                quarantine_row(quarantine, row_number, to_text(b' '.join(line)),
+                               'expected 36 columns, found {}'.format(number_of_columns))
+                continue
+            check_number_columns_in_row(to_text(b' '.join(line)).split(' '), 36, False)
+
+        try:
+            append(to_text(line[1]), int(line[29]), int(line[10]), int(line[11]), int(line[12]), int(line[13]))
+        except (ValueError, IndexError):
+            if quarantine is None:
+                raise malformed_row_error(to_text(b' '.join(line)), 6)
+            quarantine_row(quarantine, row_number, to_text(b' '.join(line)), 'not a number')
+            continue
+
+        # A run of rows of the same region is its first pass, unless an earlier run of that region has ended
+        if extended:
+            key = (line[1], rows.codes[-1])
+            if key != last_key:
+                passed.add(last_key)
+                first_pass = 0 if key in passed else 1
+                last_key = key
+            rows.first_passes.append(first_pass)
+
+    return rows
+
+
+"*** TRT index ***"
+
+# The TRT values of one imgfile and code combination, in the order of the last five columns of an act file:
+# The total fixation duration, the number of fixations, the number of fixations with a bad quality, and the total
+# duration and number of fixations with a good quality (qual 0)
+TrtEntry = collections.namedtuple('TrtEntry', ['totfixdur', 'totfixcnt', 'numfixqualnot0', 'totfixqual0dur',
+                                               'totfixqual0cnt'])
+
+# The TRT values with the extra metrics, used with --extra-metrics: the total SaccInDur and SaccOutDur of all fixations
+# and of the fixations with a good quality, and the fixation duration of the first pass and of the later passes. The
+# first pass of a region is its first uninterrupted run of fixations, in the order of the JNF file
+ExtendedTrtEntry = collections.namedtuple('ExtendedTrtEntry', TrtEntry._fields + (
+    'totsaccindur', 'totsaccoutdur', 'totsaccinqual0dur', 'totsaccoutqual0dur', 'firstpassdur', 'secondpassdur'))
+
+# The TRT values used for agc lines without fixations
+_empty_trt_entry = TrtEntry(0, 0, 0, 0, 0)
+_empty_extended_trt_entry = ExtendedTrtEntry(*[0] * 11)
+
+# Used to write the TRT values at the end of an act line, by the length of the line
+_trt_formats = {33: ' %s' * 5, 39: ' %s' * 11}
+
+
+def format_act_row(row):
+    """Joins the columns of an act row with spaces. The columns after the 28 agc columns are the TRT values, which can
+    be numbers"""
+    return ' '.join(row[:28]) + _trt_formats[len(row)] % tuple(row[28:])
+
+
+def act_header(extra_metrics):
+    """Returns the columns of an act file, with the columns of the extra metrics if they are calculated"""
+    return _act_header + _extra_metric_columns if extra_metrics else _act_header
+
+
+def all_act_header(extra_metrics):
+    """Returns the header line of allACTFiles.txt, with the columns of the extra metrics if they are calculated"""
+    if not extra_metrics:
+        return _all_act_header
+
+    return _all_act_header[:-1] + ' ' + ' '.join(_extra_metric_columns) + '\n'
+
+
+"*** Ags region summaries ***"
+
+
+class AgsSummary(object):
+    """The number of samples and fixations, and the dwell time, of every region in an ags file.
+
+    A region is a code of an imgfile of a participant. The samples are counted, and the fixations are counted by their
+    fixnr: a fixation is counted once for every region it has samples in, with its fixdur added to the dwell time
+    (totfixdur) of that region. Negative fixdur values are counted as 0, like in the TRT. Only samples of fixations
+    (event F) count towards the fixations.
+
+    The regions are kept in the order in which they are first found.
+    """
+    __slots__ = ('regions',)
+
+    def __init__(self):
+        # A [samples, fixnrs, totfixdur, NumFixQualNot0] list for every (subjectnr, imgfile, code) tuple
+        self.regions = collections.OrderedDict()
+
+    def add_lines(self, lines):
+        """Adds the samples of some lines of an ags file. Lines without the code column are left out.
+
+        :param lines: A list of lines of the ags file, without newline characters
+        :return:
+        """
+        regions = self.regions
+
+        for line in lines:
+            # Only split the line up to the code column
+            columns = line.split(' ', 15)
+            if len(columns) < 15:
+                continue
+
+            key = (columns[4], columns[1], columns[14])
+            region = regions.get(key)
+            if region is None:
+                region = regions[key] = [0, set(), 0, 0]
+
+            region[0] += 1
+
+            # Add the fixation of this sample, if it wasn't already counted in this region
+            if columns[8] == 'F' and columns[9] not in region[1]:
+                try:
+                    fixation = int(columns[10])
+                except ValueError:
+                    continue
+
+                region[1].add(columns[9])
+                region[2] += fixation if fixation > 0 else 0
+                if columns[11] != '0':
+                    region[3] += 1
+
+    def write(self, output_file, imgfile_splits):
+        """Writes a line for every region to allAGSSummary.txt, with the imgfile split into the cond and item.
+
+        Regions of which the imgfile isn't named using the naming scheme are left out, like their lines are left out of
+        allAGSFiles.txt.
+
+        :param output_file: A file IO object of allAGSSummary.txt
+        :param imgfile_splits: The ImgfileSplits used to look up the cond and item
+        :return: The number of lines written
+        """
+        number_of_lines = 0
+        for (subjectnr, imgfile, code), (samples, fixnrs, fixdur, qual_not_0) in self.regions.items():
+            imgfile_splits.lookups += 1
+            cond_item = imgfile_splits[imgfile]
+            if cond_item is None:
+                continue
+
+            output_file.write('{} {} {} {} {} {} {}\n'.format(subjectnr, cond_item, code, samples, len(fixnrs), fixdur,
+                                                             qual_not_0))
+            number_of_lines += 1
+
+        return number_of_lines
+
+
+"*** Processing functions ***"
+
+
+def sort_jnf_file(file, quarantine=None, extended=False):
+    """This function sorts the entries in a JNF file
+
+    This function loads a JNF files, and sorts it's contents on the imgfile and code fields, in ascending order.
+    It also ignores the column headers, so that we do not process it in any step. Only the columns needed by make_trt
+    are kept.
+
+    :param file: The file to be read
+    :param quarantine: A list to add malformed rows to instead of using them, in lenient mode (optional)
+    :param extended: If the first passes needed for the extra metrics should be kept as well
+    :return: A JnfRows with the rows of the file, sorted on the imgfile and code fields (columns 2 and 30)
+    """
+    return read_jnf_rows(file, quarantine, extended).sorted()
+
+
+def make_trt(lines, extended=False):
+    """This function calculates the missing values from a JNF file.
+
+    :param lines: A JnfRows with the sorted rows of the JNF file
+    :param extended: If the extra metrics should be calculated as well. The lines should then be read with extended
+    :return: a dictionary with as key a (pla_name, code) tuple, with as value the TRT values in a TrtEntry, or in an
+             ExtendedTrtEntry if extended
+    """
+    # Programmer's note: This is all magic!
+
+    # Define all used variables
+    last_pla_name       = None
+    last_code           = None
+    last_fixation       = None
+    last_sacc_in        = None
+    last_sacc_out       = None
+    last_ok_fixation    = None
+    last_ok_sacc_in     = None
+    last_ok_sacc_out    = None
+    lastqualtotfix      = None
+    lastnumbertotfixok  = None
+    lastnumbertotfix    = None
+    last_first_pass     = None
+
+    # This dict will contain the TRT entries using the pla_name and code fields as key
+    trt = {}
+
+    # A JNF file with only the column headers has no groups at all
+    if not len(lines):
+        return trt
+
+    # Loop over the lines. The lines are already checked and cast to the right types by read_jnf_rows
+    for pla_name, code, fixation, sacc_in, sacc_out, qual, first_pass in lines.with_first_passes():
+        # Correct negative fixations to 0
+        if fixation < 0:
+            fixation    = 0
+
+        # Default values
+        ok_fixation     = 0
+        ok_sacc_in      = 0
+        ok_sacc_out     = 0
+        qualtotfix      = 1
+        numbertotfix    = 1
+        numbertotfixok  = 0
+
+        # If qual = 0, we need to change some of the values specified under 'default values'
+        if qual == 0:
+            ok_fixation         = fixation
+            ok_sacc_in          = sacc_in
+            ok_sacc_out         = sacc_out
+            qualtotfix          = 0
+            numbertotfixok      = 1
+
+        # If this line belongs to the same group
+        if pla_name == last_pla_name and code == last_code:
+            # Add all values to the counters
+            last_fixation       = fixation          + last_fixation
+            last_sacc_in        = sacc_in           + last_sacc_in
+            last_sacc_out       = sacc_out          + last_sacc_out
+
+            last_ok_fixation    = ok_fixation       + last_ok_fixation
+            last_ok_sacc_in     = ok_sacc_in        + last_ok_sacc_in
+            last_ok_sacc_out    = ok_sacc_out       + last_ok_sacc_out
+
+            last_pla_name       = pla_name
+            last_code           = code
+
+            lastqualtotfix      = qualtotfix        + lastqualtotfix
+            lastnumbertotfixok  = numbertotfixok    + lastnumbertotfixok
+            lastnumbertotfix    = numbertotfix      + lastnumbertotfix
+
+            if first_pass:
+                last_first_pass = fixation          + last_first_pass
+        # Else it's a new group (or the first group)
+        else:
+            # If this is not the first group encountered
+            if last_pla_name is not None:
+                # Add the last group to the dict
+                trt[(last_pla_name, last_code)] = TrtEntry(
+                        last_fixation,
+                        lastnumbertotfix,
+                        lastqualtotfix,
+                        last_ok_fixation,
+                        lastnumbertotfixok
+                    ) if not extended else ExtendedTrtEntry(
+                        last_fixation,
+                        lastnumbertotfix,
+                        lastqualtotfix,
+                        last_ok_fixation,
+                        lastnumbertotfixok,
+                        last_sacc_in,
+                        last_sacc_out,
+                        last_ok_sacc_in,
+                        last_ok_sacc_out,
+                        last_first_pass,
+                        last_fixation - last_first_pass
+                    )
+
+            # Initialize all counters with this line's value
+            last_pla_name       = pla_name
+            last_code           = code
+            last_fixation       = fixation
+            last_sacc_in        = sacc_in
+            last_sacc_out       = sacc_out
+            last_first_pass     = fixation if first_pass else 0
+
+            if qual == 0:
+                last_ok_fixation    = fixation
+                last_ok_sacc_in     = sacc_in
+                last_ok_sacc_out    = sacc_out
+                lastqualtotfix      = 0
+                lastnumbertotfix    = 1
+                lastnumbertotfixok  = 1
+            else:
+                last_ok_fixation    = 0
+                last_ok_sacc_in     = 0
+                last_ok_sacc_out    = 0
+                lastqualtotfix      = 1
+                lastnumbertotfix    = 1
+                lastnumbertotfixok  = 0
+
+    # Add the last group to the dict
+    trt[(last_pla_name, last_code)] = TrtEntry(
+            last_fixation,
+            lastnumbertotfix,
+            lastqualtotfix,
+            last_ok_fixation,
+            lastnumbertotfixok
+        ) if not extended else ExtendedTrtEntry(
+            last_fixation,
+            lastnumbertotfix,
+            lastqualtotfix,
+            last_ok_fixation,
+            lastnumbertotfixok,
+            last_sacc_in,
+            last_sacc_out,
+            last_ok_sacc_in,
+            last_ok_sacc_out,
+            last_first_pass,
+            last_fixation - last_first_pass
+        )
+
+    return trt
+
+
+def make_trt_hashed(file, quarantine=None, extended=False):
+    """This function calculates the same TRT as make_trt, but doesn't need the JNF file to be sorted.
+
+    Instead of looking for the borders between groups in a sorted file, it adds every line to the totals of its group
+    directly while reading the file. The groups are kept in a dict using the pla_name and code as key. This way the
+    file only has to be read once, and doesn't have to be sorted at all.
+
+    :param file: The JNF file to be read
+    :param quarantine: A list to add malformed rows to instead of using them, in lenient mode (optional)
+    :param extended: If the extra metrics should be calculated as well
+    :return: a dictionary with as key a (pla_name, code) tuple, with as value the TRT values in a TrtEntry, or in an
+             ExtendedTrtEntry if extended
+    """
+    # This dict will contain the totals for every group, in the same order as the TRT values. With extended, the
+    # totals also contain the extra metrics, followed by if the first pass of the group has ended
+    groups = {}
+    last_totals = None
+
+    # Go over the lines one by one, only splitting them up to the code column
+    for row_number, (number_of_columns, line) in enumerate(iter_columns(file, 29), 1):
+        # Check if the line is complete
+        if number_of_columns != 36:
+            if quarantine is not None:
+                quarantine_row(quarantine, row_number, to_text(b' '.join(line)),
+                               'expected 36 columns, found {}'.format(number_of_columns))
+                continue
+            check_number_columns_in_row(to_text(b' '.join(line)).split(' '), 36, False)
+
+        # Cast values to the right types and put them in more descriptive variable names.
+        try:
+            fixation    = int(line[10])
+            qual        = int(line[13])
+            key         = (line[1], int(line[29]))
+            if extended:
+                sacc_in     = int(line[11])
+                sacc_out    = int(line[12])
+        except (ValueError, IndexError):
+            if quarantine is None:
+                raise malformed_row_error(to_text(b' '.join(line)), 6)
+            quarantine_row(quarantine, row_number, to_text(b' '.join(line)), 'not a number')
+            continue
+
+        # Correct negative fixations to 0
+        if fixation < 0:
+            fixation    = 0
+
+        # Get the totals of this group, or start a new group
+        totals = groups.get(key)
+        if totals is None:
+            totals = groups[key] = [0] * (12 if extended else 5)
+
+        # Add this line's values to the totals
+        totals[0] += fixation
+        totals[1] += 1
+        if qual == 0:
+            totals[3] += fixation
+            totals[4] += 1
+        else:
+            totals[2] += 1
+
+        if extended:
+            totals[5] += sacc_in
+            totals[6] += sacc_out
+            if qual == 0:
+                totals[7] += sacc_in
+                totals[8] += sacc_out
+
+            # The first pass of the last group ends when a line of another group is found
+            if totals is not last_totals:
+                if last_totals is not None:
+                    last_totals[11] = 1
+                last_totals = totals
+            if not totals[11]:
+                totals[9] += fixation
+
+    # Put the totals in the same dict make_trt returns
+    trt = {}
+    for (pla_name, code), totals in groups.items():
+        if extended:
+            trt[(to_text(pla_name), code)] = ExtendedTrtEntry(*totals[:10] + [totals[0] - totals[9]])
+        else:
+            trt[(to_text(pla_name), code)] = TrtEntry(*totals)
+
+    return trt
+
+
+def make_trt_numpy(file, quarantine=None, extended=False):
+    """This function calculates the same TRT as make_trt, but uses NumPy to do so.
+
+    Instead of sorting the lines and going over them one by one, it loads the needed columns of the JNF file into
+    arrays and sums them for every imgfile and code combination at once. This means it doesn't need sort_jnf_file.
+
+    NumPy can't skip malformed rows or tell which row is malformed, so the TRT of a file NumPy can't load is calculated
+    by make_trt_hashed instead. In lenient mode that quarantines the malformed rows, otherwise it stops at the first
+    one.
+
+    :param file: The JNF file to be read
+    :param quarantine: A list to add malformed rows to instead of using them, in lenient mode (optional)
+    :param extended: If the extra metrics should be calculated as well
+    :return: a dictionary with as key a (pla_name, code) tuple, with as value the TRT values in a TrtEntry, or in an
+             ExtendedTrtEntry if extended
+    """
+    # Check if the file starts with the column headers, so that we can skip it
+    with open_file(file) as f:
+        header_lines = 1 if f.readline().startswith('expname') else 0
+
+    # Load the fixdur, SaccInDur, SaccOutDur, Qual and code columns as integers, and the imgfile column as strings
+    try:
+        with open_file(file) as f:
+            columns = numpy.loadtxt(f, dtype=numpy.int64, delimiter=' ', skiprows=header_lines,
+                                    usecols=(10, 11, 12, 13, 29), ndmin=2)
+        with open_file(file) as f:
+            pla_names = numpy.loadtxt(f, dtype=str, delimiter=' ', skiprows=header_lines, usecols=(1,), ndmin=1)
+    except ValueError:
+        return make_trt_hashed(file, quarantine, extended)
+
+    if not len(columns):
+        return {}
+
+    # Correct negative fixations to 0
+    fixation = numpy.maximum(columns[:, 0], 0)
+    qual_ok = columns[:, 3] == 0
+    code = columns[:, 4]
+
+    # Give every imgfile and code combination a group number
+    names, name_ids = numpy.unique(pla_names, return_inverse=True)
+    groups, group_ids = numpy.unique(numpy.column_stack((name_ids.reshape(-1), code)), axis=0, return_inverse=True)
+    group_ids = group_ids.reshape(-1)
+
+    # Sum the values of every group
+    totals = numpy.column_stack((
+        numpy.bincount(group_ids, weights=fixation),
+        numpy.bincount(group_ids),
+        numpy.bincount(group_ids, weights=~qual_ok),
+        numpy.bincount(group_ids, weights=fixation * qual_ok),
+        numpy.bincount(group_ids, weights=qual_ok),
+    )).astype(numpy.int64)
+
+    if extended:
+        # Number the runs of lines of the same group. The first pass of a group is the run of its first line
+        run_ids = numpy.cumsum(numpy.concatenate(([True], group_ids[1:] != group_ids[:-1]))) - 1
+        first_lines = numpy.unique(group_ids, return_index=True)[1]
+        first_pass = fixation * (run_ids == run_ids[first_lines][group_ids])
+
+        first_pass_totals = numpy.bincount(group_ids, weights=first_pass)
+        totals = numpy.column_stack((
+            totals,
+            numpy.bincount(group_ids, weights=columns[:, 1]),
+            numpy.bincount(group_ids, weights=columns[:, 2]),
+            numpy.bincount(group_ids, weights=columns[:, 1] * qual_ok),
+            numpy.bincount(group_ids, weights=columns[:, 2] * qual_ok),
+            first_pass_totals,
+            totals[:, 0] - first_pass_totals,
+        )).astype(numpy.int64)
+
+    # Put the totals in the same dict make_trt returns
+    trt_entry = ExtendedTrtEntry if extended else TrtEntry
+    trt = {}
+    for (name_id, group_code), values in zip(groups.tolist(), totals.tolist()):
+        trt[(names[name_id], group_code)] = trt_entry(*values)
+
+    return trt
+
+
+def iter_act(trt, agc, quarantine=None, extended=False):
+    """This function generates the lines of the act file for a given agc file and a given TRT dict, one by one.
+
+    Every agc line is only read and combined with its TRT values when the next line is asked for, so a consumer that
+    only needs some of the lines doesn't have to wait for (or store) all of them.
+
+    :param trt: The TRT dict generated by make_trt(1).
+    :param agc: The location of the agc file
+    :param quarantine: A list to add malformed rows to instead of stopping, in lenient mode (optional)
+    :param extended: If the TRT contains the extra metrics
+    :return: A generator giving lists containing the strings of the agc line followed by the TRT values as integers.
+    """
+    empty_trt_entry = _empty_extended_trt_entry if extended else _empty_trt_entry
+
+    # For every line of the agc file, split into columns
+    for row_number, line in enumerate(iter_rows(agc), 1):
+        # Check if the line is complete
+        if len(line) != 28:
+            if quarantine is not None:
+                quarantine_row(quarantine, row_number, ' '.join(line),
+                               'expected 28 columns, found {}'.format(len(line)))
+                continue
+            check_number_columns_in_row(line, 28, True)
+
+        # Combine the agc line with the TRT values of its imgfile and code, or with zero's if the TRT has no entry for
+        # this line
+        try:
+            line.extend(trt.get((line[3], int(line[5])), empty_trt_entry))
+        except ValueError:
+            if quarantine is None:
+                raise malformed_row_error(' '.join(line), 4)
+            quarantine_row(quarantine, row_number, ' '.join(line), 'not a number')
+            continue
+
+        yield line
+
+
+def make_act(trt, agc, quarantine=None, extended=False):
+    """This function generates a act file for a given agc file and a given TRT dict.
+
+    :param trt: The TRT dict generated by make_trt(1).
+    :param agc: The location of the agc file
+    :param quarantine: A list to add malformed rows to instead of stopping, in lenient mode (optional)
+    :param extended: If the TRT contains the extra metrics
+    :return: A list of lists, containing the strings of the agc line followed by the TRT values as integers. Which
+             represents an act file.
+    """
+    return list(iter_act(trt, agc, quarantine, extended))
+
+
+def make_participant_trt(result_path, file, engine='python', records=None, verbose=True, quarantine=None,
+                         extra_metrics=False, memory_trace=None):
+    """This function calculates the TRT of a single JNF file.
+
+    This function only uses its arguments, so that it can also be run in a different process or thread.
+
+    :param result_path: The folder containing the JNF file
+    :param file: The filename of the JNF file
+    :param engine: The engine used to calculate the TRT, either 'python', 'hash' or 'numpy'
+    :param records: A list to add the records of the stages run to, for the run report (optional)
+    :param verbose: If the progress should be printed
+    :param quarantine: A dict to add the malformed rows of the JNF file to by its path, in lenient mode (optional)
+    :param extra_metrics: If the extra metrics should be calculated as well
+    :param memory_trace: The MemoryTrace of the run, if its memory is traced (optional)
+    :return: The filename without extension and the TRT dict
+    """
+    # Removed the .JNF (and compression) extension to get the filename
+    short_filename = strip_compression(file)[:-4]
+    jnf = os.path.join(result_path, file)
+    rejected = [] if quarantine is not None else None
+    if records is None:
+        records = []
+
+    if engine == 'hash':
+        # Calculate the TRT for this JNF while reading it, without sorting it
+        if verbose:
+            print('Calculating TRT for {}'.format(short_filename))
+        start = stage_start()
+        trt = make_trt_hashed(jnf, rejected, extra_metrics)
+        record_stage(records, 'make_trt_hashed', short_filename, start, memory_trace,
+                     rows_read=count_trt_fixations(trt), rows_written=len(trt), bytes_read=os.path.getsize(jnf))
+    elif engine == 'numpy':
+        # Calculate the TRT for this JNF straight from the file
+        if verbose:
+            print('Calculating TRT for {}'.format(short_filename))
+        start = stage_start()
+        trt = make_trt_numpy(jnf, rejected, extra_metrics)
+        record_stage(records, 'make_trt_numpy', short_filename, start, memory_trace,
+                     rows_read=count_trt_fixations(trt), rows_written=len(trt), bytes_read=os.path.getsize(jnf))
+    else:
+        # Sort the lines in the file
+        if verbose:
+            print('Sorting {}'.format(short_filename))
+        start = stage_start()
+        sorted_lines = sort_jnf_file(jnf, rejected, extra_metrics)
+        record_stage(records, 'sort_jnf_file', short_filename, start, memory_trace, rows_read=len(sorted_lines),
+                     rows_written=len(sorted_lines), bytes_read=os.path.getsize(jnf))
+
+        # Calculate the TRT for this JNF using the sorted lines
+        if verbose:
+            print('Calculating TRT for {}'.format(short_filename))
+        start = stage_start()
+        trt = make_trt(sorted_lines, extra_metrics)
+        record_stage(records, 'make_trt', short_filename, start, memory_trace, rows_read=len(sorted_lines),
+                     rows_written=len(trt))
+
+    if rejected:
+        quarantine[jnf] = rejected
+
+    return short_filename, trt
+
+
+def make_participant_act(result_path, file, engine='python', records=None, verbose=True, quarantine=None,
+                         extra_metrics=False, memory_trace=None):
+    """This function makes the act file of a single JNF file and its corresponding agc file, without writing it.
+
+    It calculates the TRT for the JNF file and uses that TRT to make the act file for the agc file.
+
+    This function only uses its arguments, so that it can also be run in a different process or thread.
+
+    :param result_path: The folder containing the JNF and agc file
+    :param file: The filename of the JNF file
+    :param engine: The engine used to calculate the TRT, either 'python', 'hash' or 'numpy'
+    :param records: A list to add the records of the stages run to, for the run report (optional)
+    :param verbose: If the progress should be printed
+    :param quarantine: A dict to add the malformed rows of the JNF and agc file to by their paths, in lenient mode
+                       (optional)
+    :param extra_metrics: If the extra metrics should be added to the act file
+    :param memory_trace: The MemoryTrace of the run, if its memory is traced (optional)
+    :return: The filename without extension and a list of lists representing the act file (without headers)
+    """
+    if records is None:
+        records = []
+    short_filename, trt = make_participant_trt(result_path, file, engine, records, verbose, quarantine,
+                                               extra_metrics, memory_trace)
+    agc = find_file(result_path, short_filename + '.agc')
+    rejected = [] if quarantine is not None else None
+
+    # Make the act file for the corresponding agc file
+    if verbose:
+        print('Making act for {}'.format(short_filename))
+    start = stage_start()
+    act = make_act(trt, agc, rejected, extra_metrics)
+    record_stage(records, 'make_act', short_filename, start, memory_trace, rows_read=len(act) + len(rejected or []),
+                 rows_written=len(act), bytes_read=os.path.getsize(agc))
+
+    if rejected:
+        quarantine[agc] = rejected
+
+    return short_filename, act
+
+
+def process_participant(result_path, output_path, file, engine='python', lenient=False, extra_metrics=False,
+                        memory_trace=None):
+    """This function processes a single JNF file and its corresponding agc file.
+
+    It makes the act file using make_participant_act, and writes it to the output path. In lenient mode, malformed
+    rows are left out and written to a quarantine report instead of stopping the script.
+
+    This function only uses its arguments, so that it can also be run in a different process.
+
+    :param result_path: The folder containing the JNF and agc file
+    :param output_path: The folder to write the act file to
+    :param file: The filename of the JNF file
+    :param engine: The engine used to calculate the TRT, either 'python', 'hash' or 'numpy'
+    :param lenient: If malformed rows should be quarantined instead of stopping the script
+    :param extra_metrics: If the extra metrics should be added to the act file
+    :param memory_trace: The MemoryTrace of the run, if its memory is traced. Only used in the process of the run
+                         (optional)
+    :return: The filename without extension, a list of lists representing the act file (without headers) and a list
+             of records of the stages run for the run report
+    """
+    records = []
+    quarantine = {} if lenient else None
+    short_filename, act = make_participant_act(result_path, file, engine, records, quarantine=quarantine,
+                                               extra_metrics=extra_metrics, memory_trace=memory_trace)
+
+    # Write the malformed rows of the JNF and agc file to their quarantine reports
+    for path, rejected in sorted((quarantine or {}).items()):
+        write_quarantine(output_path, path, rejected, records, memory_trace)
+
+    # Write the act file to an actual file on the filesysten. The headers are only written to this file, the
+    # script doesn't need them, but humans do in the written act file. It's written to a temporary file first, so that
+    # an act file is either complete or not there at all if the script is stopped
+    start = stage_start()
+    act_file = os.path.join(output_path, '{}.act'.format(short_filename))
+    with open(act_file + '.tmp', 'w+') as f:
+        f.write(' '.join(act_header(extra_metrics)) + "\n")
+        f.writelines(format_act_row(x) + "\n" for x in act)
+    replace_file(act_file + '.tmp', act_file)
+    record_stage(records, 'write_act', short_filename, start, memory_trace, rows_written=len(act) + 1,
+                 bytes_written=os.path.getsize(act_file))
+
+    return short_filename, act, records
+
+
+def count_trt_fixations(trt):
+    """Returns the number of fixations in a TRT dict, which is the number of JNF lines it was calculated from"""
+    return sum(values.totfixcnt for values in trt.values())
+
+
+def init_participant_process():
+    """This function is run in every process of the process pool before it starts processing.
+
+    The processes can't ask the user to press enter, so the parent process will do that instead.
+    :return:
+    """
+    global _safe_exit
+    _safe_exit = False
+
+
+def process_participant_job(job):
+    """This function runs process_participant in a process of the process pool.
+
+    If the processing stops the script, the exit code is handed to the parent process instead. Otherwise the process
+    would die, and the pool would wait for it forever.
+
+    :param job: A tuple with the arguments for process_participant
+    :return: A tuple with the filename without extension, the act file, the stage records and the exit code (None if
+             all went well)
+    """
+    try:
+        return process_participant(*job) + (None,)
+    except (SystemExit, FixationError) as e:
+        return strip_compression(job[2])[:-4], None, [], e.code
+
+
+def merge_resumed_participants(context, files, resumed, results):
+    """This function gives the results of the processed participants and the act files of the resumed participants,
+    in the order of the JNF files.
+
+    :param context: The RunContext of the run
+    :param files: The filenames of all JNF files
+    :param resumed: The filenames of the JNF files of the participants finished by the interrupted run
+    :param results: The results of the other participants, in the same form as process_participant_job returns them
+    :return: A generator giving the results of all participants
+    """
+    for file in files:
+        if file not in resumed:
+            yield next(results)
+            continue
+
+        # Read the act file written by the interrupted run
+        short_filename = strip_compression(file)[:-4]
+        yield short_filename, read_act_file(os.path.join(context.output_path, short_filename + '.act')), [], None
+
+
+def process_jnf_agc_files(context):
+    """This function processes all JNF and agc files.
+
+    This function opens an JNF file, sorts it and calculates a trt for it. It then uses this generated TRT to create a
+    act file for the corresponding agc file.
+
+    When streaming is enabled, every act file is also added to allACTFiles.txt right after it's made. This way only one
+    act file needs to be kept in memory, instead of all of them.
+
+    When more than one job is used, the files are processed by a pool of processes. The act files are still handled in
+    the order of the JNF files, so the output is the same.
+
+    When the pipeline is enabled, the files of the next participants are read in one background thread and processed in
+    another, while the act files of the previous participants are being combined.
+
+    When processing incrementally, only the files that changed since the previous run are processed. The act files
+    are not kept in memory, combine_act_files will read them from disk when needed.
+
+    Every finished participant is added to the journal. When resuming, the participants finished by the interrupted
+    run are not processed again, their act files are read from disk instead.
+    :param context: The RunContext of the run
+    :return: nothing!
+    """
+    config = context.config
+
+    # If there are no agc files, display a nice message and stop
+    if not context.agc_present:
+        print('No agc files found, skipping this step')
+        print()
+        return
+
+    # Get a sorted list of all JNF files in the result dir
+    files = list_files(context.result_path, '.jnf')
+
+    # When processing incrementally, skip the files that didn't change
+    if config.incremental:
+        unchanged = [file for file in files if check_participant(context, file)]
+        for file in unchanged:
+            print('{} has not changed, skipping it'.format(strip_compression(file)[:-4]))
+        if unchanged:
+            print()
+        files = [file for file in files if file not in unchanged]
+
+    # When resuming, skip the files finished by the interrupted run. Incremental runs already skipped them above
+    resumed = []
+    if config.resume and not config.incremental:
+        resumed = [file for file in files if check_resumed_participant(context, file)]
+        for file in resumed:
+            print('{} was already processed, skipping it'.format(strip_compression(file)[:-4]))
+        if resumed:
+            print()
+
+    # The JNF file of every participant, by filename without extension
+    participants = dict((strip_compression(file)[:-4], file) for file in files)
+
+    jobs = [(context.result_path, context.output_path, file, config.engine, config.lenient, config.extra_metrics)
+            for file in files if file not in resumed]
+    memory_trace = context.memory_trace
+
+    # Process the files in a pool of processes if requested, otherwise process them one by one in this process
+    pool = None
+    if config.jobs != 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(config.jobs or None, init_participant_process)
+        results = pool.imap(process_participant_job, jobs)
+    elif config.pipeline:
+        results = prefetch((process_prefetched_participant(x, memory_trace) for x in
+                            prefetch((read_participant_files(job) for job in jobs), _pipeline_depth)), _pipeline_depth)
+    else:
+        results = (process_participant(*job, memory_trace=memory_trace) + (None,) for job in jobs)
+
+    # Put the act files of the resumed participants between the processed ones
+    processed = results
+    if resumed:
+        results = merge_resumed_participants(context, files, resumed, processed)
+
+    # When streaming, open the combined file now so we can add every act file to it as soon as it's made
+    combined_file = None
+    if config.stream and not config.incremental:
+        combined_file = open_combined_file(context, 'allACTFiles.txt')
+        combined_file.write(all_act_header(config.extra_metrics))
+
+    try:
+        # For every processed JNF file, in the order of the JNF files
+        for short_filename, act, records, exit_code in results:
+            # Stop if the processing of this file failed, the problem was already explained by its process
+            if exit_code is not None:
+                raise FixationError('Processing {} stopped with exit code {}'.format(short_filename, exit_code),
+                                    exit_code)
+
+            context.records.extend(records)
+
+            if config.incremental:
+                # Remember the new act file in the manifest, combine_act_files will read it when needed
+                entry = context.manifest['participants'][short_filename]
+                entry['act'] = file_signature(os.path.join(context.output_path, '{}.act'.format(short_filename)))
+
+                # The manifest entry also tells a resumed run that this participant is finished
+                journal_participant(context, short_filename, entry)
+            else:
+                # Remember that this participant is finished, the sizes and modification times of its files are
+                # enough to check if they changed before resuming
+                if participants[short_filename] not in resumed:
+                    paths = participant_paths(context, participants[short_filename])
+                    journal_participant(context, short_filename,
+                                        dict((x, file_signature(path, None, False)) for x, path in paths.items()))
+
+                if combined_file is not None:
+                    # Add this act file to allACTFiles.txt straight away, after which we can forget about it
+                    add_act_file(context, short_filename, act, combined_file)
+                else:
+                    # Add this act file to the list of all act files
+                    context.act_files.append((short_filename, act))
+
+            # Print a separator line for output readability
+            print()
+
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            # This stops the processes right away if we're stopping because of an error
+            pool.terminate()
+            pool.join()
+        elif config.pipeline:
+            # This stops the background threads of the pipeline
+            processed.close()
+
+        if combined_file is not None:
+            combined_file.close()
+
+    if combined_file is not None:
+        print('Created allActFiles.txt')
+        print()
+
+
+def process_combined_file_lines(lines, imgfile_index, file, format_line=' '.join, quarantine=None, first_row=1,
+                                imgfile_splits=None):
+    """This function processes every supplied line and writes it to a supplied file
+
+    This function is used by both combine functions to write their lines to the combined file.
+    It also splits the imgfile column in two columns: cond and item. You need to specify the index
+    this column.
+
+    :param lines: A list of lines to process
+    :param imgfile_index: The index on which the imgfile field lives
+    :param file: A file IO object to write to
+    :param format_line: The function used to join the columns of a line (optional)
+    :param quarantine: A list to add malformed lines to instead of stopping, in lenient mode (optional)
+    :param first_row: The row number of the first line in its file, for the quarantine (optional)
+    :param imgfile_splits: The ImgfileSplits used to look up the cond and item, a new one if not given (optional)
+    :return: /dev/null
+    """
+    if imgfile_splits is None:
+        imgfile_splits = ImgfileSplits()
+
+    # For every line in this act
+    for row_number, line in enumerate(lines, first_row):
+        # If this line has an imgfile field, replace it with the cond and item fields
+        if len(line) > imgfile_index:
+            imgfile_splits.lookups += 1
+            cond_item = imgfile_splits[line[imgfile_index]]
+
+            # Sanity check mostly to see if it's actually found something, should not error
+            if cond_item is None:
+                # In lenient mode, leave the line out
+                if quarantine is not None:
+                    quarantine_row(quarantine, row_number, format_line(line), 'imgfile is not named {cond+item}.BMP')
+                    continue
+
+                # But just in case, handle it
+                print("Badly formatted line found in this file! Stopping!")
+                print("Please check if Fixation hasn't written anything weird to this file")
+                print("Misformatted line: {}".format(format_line(line)))
+                raise FixationError('Badly formatted line: {}'.format(format_line(line)), 2)
+
+            line = line[:imgfile_index] + [cond_item] + line[imgfile_index + 1:]
+
+        # Write this line to the output file
+        file.write(format_line(line))
+        file.write("\n")
+
+
+def add_act_file(context, short_filename, act, output_file):
+    """This function adds an act file to the combined act file.
+
+    :param context: The RunContext of the run
+    :param short_filename: The filename of the act file without extension
+    :param act: A list of lists representing the act file (without headers)
+    :param output_file: A file IO object of the combined file
+    :return: The number of lines added
+    """
+    # Inform the user of what we are doing
+    print('Adding {}.act'.format(short_filename))
+
+    start = stage_start()
+    position = output_file.tell()
+
+    # Process the lines of this file
+    process_combined_file_lines(act, 3, output_file, format_act_row, imgfile_splits=context.imgfile_cache)
+
+    record_stage(context.records, 'combine_act_files', short_filename, start, context.memory_trace,
+                 rows_read=len(act), rows_written=len(act), bytes_written=output_file.tell() - position)
+
+    return len(act)
+
+
+def combine_act_files(context):
+    """This function combines all generated act files.
+
+    This function takes all generated act files, and combines it into one master file.
+    It also replaces the imgfile field of every act file with an cond and item field.
+
+    These two fields are generated out of the imgfile field.
+
+    :param context: The RunContext of the run
+    :return: Nada
+    """
+
+    # If there are no agc files, display a nice message and stop
+    if not context.agc_present:
+        print('No agc files found, skipping this step')
+        print()
+        return
+
+    # When processing incrementally, the combined file is made out of the act files on disk and the previous version
+    if context.config.incremental:
+        combine_act_files_incremental(context)
+        print()
+        return
+
+    # When streaming, allACTFiles.txt was already written while processing the individual files
+    if context.config.stream:
+        print('allACTFiles.txt was already created while processing, skipping this step')
+        print()
+        return
+
+    # open the output file
+    with open_combined_file(context, 'allACTFiles.txt') as f:
+        # Write the file headers, for clarity
+        print('Writing headers')
+        f.write(all_act_header(context.config.extra_metrics))
+        print()
+
+        # Go over all the generated act files
+        for k, v in context.act_files:
+            add_act_file(context, k, v, f)
+
+        # Inform the user that we are done creating the combined file
+        print()
+        print('Created allActFiles.txt')
+        print()
+
+
+def read_act_file(file):
+    """This function reads an act file written by process_participant.
+
+    :param file: The act file to be read
+    :return: A list of lists, containing strings. Which represents an act file (without headers).
+    """
+    return read_rows(file)
+
+
+def combine_act_files_incremental(context):
+    """This function combines all act files, only processing the act files that changed since the previous run.
+
+    The act files are read from disk. The lines of act files that didn't change are copied from the previous
+    allACTFiles.txt.
+
+    :param context: The RunContext of the run
+    :return:
+    """
+    pieces = []
+
+    # Go over all act files, in the order of the JNF files
+    for file in list_files(context.result_path, '.jnf'):
+        short_filename = strip_compression(file)[:-4]
+
+        def write(f, short_filename=short_filename):
+            act = read_act_file(os.path.join(context.output_path, '{}.act'.format(short_filename)))
+            return add_act_file(context, short_filename, act, f)
+
+        pieces.append(('{}.act'.format(short_filename), context.manifest['participants'][short_filename]['act'],
+                       write))
+
+    write_combined_file(context, 'allACTFiles.txt', all_act_header(context.config.extra_metrics), pieces)
+
+
+# The size of the chunks in which ags files are read
+_ags_chunk_size = 1024 * 1024
+
+
+def read_line_chunks(f):
+    """This function reads a file in chunks of complete lines, ignoring the column headers.
+
+    :param f: A file IO object of the file
+    :return: A generator giving the lines of every chunk, without newline characters
+    """
+    # Skip the column headers
+    chunk = f.readline()
+    if chunk.startswith('expname'):
+        chunk = ''
+
+    while True:
+        # Read a chunk of complete lines
+        chunk += f.read(_ags_chunk_size)
+        if not chunk:
+            return
+        if not chunk.endswith('\n'):
+            chunk += f.readline()
+            if not chunk.endswith('\n'):
+                chunk += '\n'
+
+        lines = chunk.split('\n')
+        lines.pop()
+        yield lines
+        chunk = ''
+
+
+def add_ags_file(context, file, output_file):
+    """This function adds an ags file to the combined ags file.
+
+    The only thing that changes in an ags line is the imgfile column, which is split into the cond and item columns.
+    So instead of splitting every line into all its columns, the file is read in large chunks, and every line in a
+    chunk is only split around the imgfile column. The cond and item of its imgfile are looked up in the imgfile cache.
+    The chunk is then written in one go.
+
+    If this doesn't work for every line in a chunk, for example because of a badly formatted line, the chunk is
+    processed line by line by process_combined_file_lines instead.
+
+    When the pipeline is enabled, the next chunks are read in a background thread while a chunk is being processed.
+
+    In lenient mode, malformed lines are left out and written to the quarantine report of the file.
+
+    When the ags summary is enabled, the regions of the lines are summarized in the same pass, in an AgsSummary that
+    is kept in the ags_summaries of the run.
+
+    :param context: The RunContext of the run
+    :param file: The ags file to be added
+    :param output_file: A file IO object of the combined file
+    :return: The number of lines added, without the quarantined lines
+    """
+    config = context.config
+    cond_items = context.imgfile_cache
+    start = stage_start()
+    position = output_file.tell()
+    quarantine = [] if config.lenient else None
+    summary = AgsSummary() if config.ags_summary else None
+
+    with open_file(file) as f:
+        # Inform the user of what we are doing
+        print('Adding {}'.format(os.path.basename(file)))
+
+        chunks = read_line_chunks(f)
+        if config.pipeline:
+            chunks = prefetch(chunks, _pipeline_depth)
+
+        number_of_lines = 0
+        for lines in chunks:
+            if summary is not None:
+                summary.add_lines(lines)
+
+            try:
+                # Replace the imgfile column of every line with the cond and item columns
+                output_file.write('\n'.join([x[0] + ' ' + cond_items[x[1]] + ' ' + x[2]
+                                             for x in [line.split(' ', 2) for line in lines]]) + '\n')
+                cond_items.lookups += len(lines)
+            except (IndexError, TypeError):
+                # Load all lines in this chunk except for the headers and split them into columns
+                lines = [x.replace('\r', '').split(' ') for x in lines if not x.startswith('expname')]
+
+                # Process the lines of this chunk
+                process_combined_file_lines(lines, 1, output_file, quarantine=quarantine,
+                                            first_row=number_of_lines + 1, imgfile_splits=cond_items)
+
+            number_of_lines += len(lines)
+
+    rejected = len(quarantine or [])
+    record_stage(context.records, 'combine_ags_files', os.path.basename(file), start, context.memory_trace,
+                 rows_read=number_of_lines, rows_written=number_of_lines - rejected, bytes_read=os.path.getsize(file),
+                 bytes_written=output_file.tell() - position)
+
+    if quarantine:
+        write_quarantine(context.output_path, file, quarantine, context.records, context.memory_trace)
+
+    if summary is not None:
+        context.ags_summaries[file] = summary
+
+    # The quarantined lines weren't written, incremental runs use this to find the lines of this file
+    return number_of_lines - rejected
+
+
+def split_imgfile(row, imgfile_index, imgfile_splits, format_line=' '.join):
+    """This function replaces the imgfile column of a row with the cond and item columns.
+
+    :param row: A list representing a row
+    :param imgfile_index: The index of the imgfile column
+    :param imgfile_splits: The ImgfileSplits used to look up the cond and item
+    :param format_line: The function used to join the columns of the row, for the error message (optional)
+    :return: A new list representing the row
+    """
+    imgfile_splits.lookups += 1
+    cond_item = imgfile_splits[row[imgfile_index]]
+
+    if cond_item is None:
+        raise FixationError('Badly formatted line: {}'.format(format_line(row)), 2)
+
+    return row[:imgfile_index] + cond_item.split(' ') + row[imgfile_index + 1:]
+
+
+def iter_ags_rows(file, imgfile_splits, quarantine=None):
+    """This function reads the rows of an ags file one by one, with the imgfile column split into cond and item.
+
+    :param file: The ags file to read
+    :param imgfile_splits: The ImgfileSplits used to look up the cond and item
+    :param quarantine: A list to add malformed rows to instead of stopping, in lenient mode (optional)
+    :return: A generator giving a list of strings for every line, with the columns of allAGSFiles.txt
+    """
+    with open_file(file) as f:
+        lines = (line for chunk in read_line_chunks(f) for line in chunk if not line.startswith('expname'))
+        for row_number, line in enumerate(lines, 1):
+            row = line.replace('\r', '').split(' ')
+            if len(row) > 1:
+                try:
+                    row = split_imgfile(row, 1, imgfile_splits)
+                except FixationError:
+                    if quarantine is None:
+                        raise
+                    quarantine_row(quarantine, row_number, line, 'imgfile is not named {cond+item}.BMP')
+                    continue
+
+            yield row
+
+
+def combine_ags_files(context):
+    """This function combines all ags files
+
+    This function takes all found ags files, and combines it into one master file.
+    It also replaces the imgfile field of every act file with an cond and item field.
+
+    These two fields are generated out of the imgfile field.
+    :param context: The RunContext of the run
+    :return:
+    """
+    # Newline in output for clarity
+    print()
+
+    # If there are no ags files, display a nice message and stop
+    if not context.ags_present:
+        print('No ags files found, skipping this step')
+        return
+
+    # Get all files ending with ags, and sort them
+    files = list_files(context.result_path, '.ags')
+
+    # When processing incrementally, only the ags files that changed since the previous run are processed
+    if context.config.incremental:
+        pieces = []
+        for file in files:
+            path = os.path.join(context.result_path, file)
+            signature = file_signature(path, context.previous_manifest['ags'].get(file))
+            context.manifest['ags'][file] = signature
+            pieces.append((file, signature, lambda output_file, path=path: add_ags_file(context, path, output_file)))
+
+        write_combined_file(context, 'allAGSFiles.txt', _all_ags_header, pieces)
+        if context.config.ags_summary:
+            write_ags_summary(context, files)
+        return
+
+    # Open the output file
+    with open_combined_file(context, 'allAGSFiles.txt') as output_file:
+        # Write the file headers, for clarity
+        print('Writing headers')
+        output_file.write(_all_ags_header)
+
+        # Loop over every file and add it
+        for file in files:
+            add_ags_file(context, os.path.join(context.result_path, file), output_file)
+
+        # Inform the user that we are done creating the file
+        print()
+        print('Created allAGSFiles.txt')
+
+    if context.config.ags_summary:
+        write_ags_summary(context, files)
+
+
+def summarize_ags_file(file):
+    """This function summarizes the regions of an ags file, for ags files that weren't added to allAGSFiles.txt in
+    this run.
+
+    :param file: The ags file
+    :return: An AgsSummary of the file
+    """
+    summary = AgsSummary()
+    with open_file(file) as f:
+        for lines in read_line_chunks(f):
+            summary.add_lines(lines)
+
+    return summary
+
+
+def write_ags_summary(context, files):
+    """This function writes allAGSSummary.txt, with the summaries of the regions of all ags files.
+
+    The summaries are made while the ags files are added to allAGSFiles.txt. When processing incrementally, the lines of
+    unchanged ags files are copied from the previous allAGSSummary.txt, like for allAGSFiles.txt.
+
+    :param context: The RunContext of the run
+    :param files: The filenames of all ags files, in order
+    :return:
+    """
+    print()
+
+    def write(output_file, path):
+        start = stage_start()
+        summary = context.ags_summaries.pop(path, None) or summarize_ags_file(path)
+        lines = summary.write(output_file, context.imgfile_cache)
+        record_stage(context.records, 'ags_summary', os.path.basename(path), start, context.memory_trace,
+                     rows_written=lines)
+        return lines
+
+    if context.config.incremental:
+        pieces = [(file, context.manifest['ags'][file],
+                   lambda output_file, path=os.path.join(context.result_path, file): write(output_file, path))
+                  for file in files]
+        write_combined_file(context, 'allAGSSummary.txt', _ags_summary_header, pieces)
+        return
+
+    with open_combined_file(context, 'allAGSSummary.txt') as output_file:
+        output_file.write(_ags_summary_header)
+        for file in files:
+            write(output_file, os.path.join(context.result_path, file))
+
+    print('Created allAGSSummary.txt')
+
+
+"*** Library API ***"
+
+
+class FixationProcessor(object):
+    """Processes a folder of Fixation files without writing any files, so that it can be used as a library.
+
+    Instead of writing allACTFiles.txt and allAGSFiles.txt, act_rows and ags_rows give their rows one by one, split into
+    the columns listed in act_columns and ags_columns. A processor keeps all its state itself, including the scan of
+    its folder, so multiple processors can be used at the same time in different threads. For example:
+
+        processor = FixationProcessor('/data/exp1/result', FixationConfig(engine='hash'))
+        for row in processor.act_rows():
+            ...
+
+    If a file can't be processed, a FixationError is raised with the exit code the script would stop with. In lenient
+    mode, malformed rows are left out instead, and kept in quarantine: a dict from the path of every file with
+    malformed rows to a list of (row number, reason, line) tuples.
+    """
+
+    # The columns of the rows given by ags_rows. The columns of act_rows depend on the config
+    ags_columns = _ags_columns
+
+    def __init__(self, result_path, config=None):
+        self.result_path = result_path
+        self.config = config or FixationConfig()
+        self.act_columns = all_act_header(self.config.extra_metrics).split()  # The columns of the rows of act_rows
+        self.records = []  # The records of every stage run, like in the run report of the script
+        self.imgfile_splits = ImgfileSplits()  # The imgfile cache of this processor
+        self.quarantine = {}  # The malformed rows left out in lenient mode, by file
+
+        # Scan the folder now, the scan is only used by this processor
+        if not os.path.isdir(result_path):
+            raise FixationError('{} does not contain Fixation files'.format(result_path), 5)
+
+        self.scan = FolderScan(list_folder(result_path)[0])
+        if not check_if_valid_path(result_path, self.scan):
+            raise FixationError('{} does not contain Fixation files'.format(result_path), 5)
+
+    def participants(self):
+        """Returns the JNF filenames of the participants, in the order in which act_rows processes them"""
+        if not does_folder_contain_files('.agc', self.result_path, self.scan.names):
+            return []
+
+        return list_files(self.result_path, '.jnf', self.scan)
+
+    def act_rows(self):
+        """A generator giving the rows of allACTFiles.txt, participant by participant.
+
+        The rows are made while they are asked for, so only the TRT of one participant is kept in memory. The TRT
+        columns are integers, all other columns are strings.
+        :return:
+        """
+        engine = self.config.engine
+        if engine == 'numpy' and numpy is None:
+            engine = 'python'
+
+        quarantine = self.quarantine if self.config.lenient else None
+
+        for file in self.participants():
+            short_filename, trt = make_participant_trt(self.result_path, file, engine, self.records,
+                                                       self.config.verbose, quarantine, self.config.extra_metrics)
+            agc = find_file(self.result_path, short_filename + '.agc', self.scan)
+            for row in iter_act(trt, agc, self.quarantine.setdefault(agc, []) if quarantine is not None else None,
+                                self.config.extra_metrics):
+                yield split_imgfile(row, 3, self.imgfile_splits, format_act_row)
+
+            # Only keep the files that had malformed rows
+            if not self.quarantine.get(agc, True):
+                del self.quarantine[agc]
+
+    def ags_rows(self):
+        """A generator giving the rows of allAGSFiles.txt, file by file. All columns are strings.
+
+        :return:
+        """
+        for file in list_files(self.result_path, '.ags', self.scan):
+            if self.config.verbose:
+                print('Adding {}'.format(file))
+
+            path = os.path.join(self.result_path, file)
+            for row in iter_ags_rows(path, self.imgfile_splits,
+                                     self.quarantine.setdefault(path, []) if self.config.lenient else None):
+                yield row
+
+            # Only keep the files that had malformed rows
+            if not self.quarantine.get(path, True):
+                del self.quarantine[path]
+
+
+def arg_parse():
+    """This function sets up a basic argument parser.
+
+    It can be used to supply the result folder directly from the command line
+
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='This script parses the standard output from Fixation. '
+                                                 'This adds extra information not given by the Fixation output '
+                                                 'and combines all act and all ags files in allACTFiles.txt and '
+                                                 'AllAgsFiles.txt.')
+    parser.add_argument('path', metavar='dir', nargs="?", type=str, help='The location of the folder containing the to '
+                                                                         'be processed files. If the folder is invalid '
+                                                                         'or omitted, it will be ignored.')
+
+    parser.add_argument('output', metavar='out', nargs="?", type=str, help='The location of the folder where the output'
+                                                                           ' should be stored. When not supplied, the '
+                                                                           'input dir will be used.')
+
+    parser.add_argument('--stream', action='store_true', help='Write every act file to allACTFiles.txt as soon as it '
+                                                              'is made, instead of keeping all act files in memory. '
+                                                              'Use this for studies with lots of participants.')
+
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='The number of processes used to process the JNF '
+                                                                  'and agc files at the same time. Use 0 to use all '
+                                                                  'CPU cores. Defaults to 1.')
+
+    parser.add_argument('--engine', choices=['python', 'hash', 'numpy'], default='python',
+                        help='The engine used to calculate the TRT. The hash engine does not sort the JNF files, '
+                             'which is faster on large JNF files. The numpy engine is faster still, but needs NumPy '
+                             'to be installed. Defaults to python.')
+
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only process the files that changed since the previous run with this option. The '
+                             'files of the previous run are described in {} in the output '
+                             'folder.'.format(_manifest_filename))
+
+    parser.add_argument('--columnar', choices=['parquet', 'arrow'],
+                        help='Also write the combined files in a typed columnar format: allACTFiles.parquet and '
+                             'allAGSFiles.parquet, or allACTFiles.arrow and allAGSFiles.arrow (Arrow IPC, which can be '
+                             'memory-mapped). Needs PyArrow to be installed.')
+
+    parser.add_argument('--compress', choices=['gzip', 'zstd'],
+                        help='Write the combined files compressed, as allACTFiles.txt.gz and allAGSFiles.txt.gz, or '
+                             'allACTFiles.txt.zst and allAGSFiles.txt.zst. zstd needs zstandard to be installed. '
+                             'Compressed input files (.JNF.gz, .agc.gz, .ags.gz, .zst) are always read.')
+
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Overlap reading, processing and writing: the files of the next participants and the next '
+                             'parts of the ags files are read in the background, and the combined files are written '
+                             'in the background. Useful when the files are on a slow (network) drive. The output is '
+                             'the same.')
+
+    parser.add_argument('--ags-summary', action='store_true',
+                        help='Also write allAGSSummary.txt, with the number of samples and fixations and the dwell '
+                             'time of every region (subjectnr, imgfile and code) in the ags files. It is made while '
+                             'the ags files are combined, without reading them again.')
+    parser.add_argument('--extra-metrics', action='store_true',
+                        help='Add six columns to the act files: the total SaccInDur and SaccOutDur of the fixations in '
+                             'the region, the same totals for the fixations with Qual 0, and the duration of the first '
+                             'pass and of the later passes through the region. They are calculated in the same pass '
+                             'over the JNF files as the other TRT values.')
+
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue a run that was stopped, for example by a crash. The participants that run '
+                             'finished are not processed again, their act files are used as they are. Every run keeps '
+                             'track of its finished participants in {} in the output folder until it is '
+                             'done.'.format(_journal_filename))
+
+    parser.add_argument('--lenient', action='store_true',
+                        help='Leave out malformed lines instead of stopping. The malformed lines of every file are '
+                             'written to a quarantine report in the output folder, named after the file (for example '
+                             'test1.agc.quarantine.txt), with their line numbers.')
+
+    parser.add_argument('--batch', metavar='dir', nargs='+',
+                        help='Process all given folders one after another without asking anything, for use in '
+                             'scheduled jobs. The output of every folder is written to that folder. With --jobs, the '
+                             'folders are processed in parallel instead of the participants. The exit code is 0 '
+                             'if all folders were processed, otherwise it is the exit code of the first folder that '
+                             'failed (2 for a malformed ags file, 4 for a malformed agc file, 5 if a folder does '
+                             'not contain Fixation files and 6 for a malformed JNF file).')
+
+    parser.add_argument('--all', action='store_true',
+                        help='Like --batch, but process every folder containing Fixation files in the current '
+                             'directory (or in dir) and its sub folders.')
+
+    parser.add_argument('--merge', action='store_true',
+                        help='With --batch or --all, also merge the combined files of all folders into '
+                             'studyACTFiles.txt and studyAGSFiles.txt, with the folder as an extra first column. These '
+                             'are written to the output folder, or to the current directory.')
+
+    parser.add_argument('--report', choices=['json', 'csv'],
+                        help='Write a report with the time, rows, bytes and memory growth of every processing step '
+                             'for every participant to fixation_report.json or fixation_report.csv in the output '
+                             'folder.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile the run with cProfile, and write the profile to fixation_profile.prof in the '
+                             'output folder, with a summary of the time spent in every processing step in '
+                             'fixation_profile.txt.')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Trace the memory allocations of the run with tracemalloc, and write the peak memory of '
+                             'every processing step and the largest allocations to fixation_memory.txt in the output '
+                             'folder.')
+
+    return parser.parse_args()
+
+
+"*** Main function ***"
+
+
+def usable_config(config):
+    """This function replaces the settings that need an optional dependency that isn't installed.
+
+    :param config: The FixationConfig asked for
+    :return: A FixationConfig that can be used with the installed dependencies
+    """
+    # The numpy engine can only be used if NumPy is installed
+    if config.engine == 'numpy' and numpy is None:
+        print()
+        print('NumPy is not installed, using the python engine instead')
+        config = config.replace(engine='python')
+
+    # The columnar output can only be written if PyArrow is installed
+    if config.columnar is not None and pyarrow is None:
+        print()
+        print('PyArrow is not installed, the combined files will only be written as text')
+        config = config.replace(columnar=None)
+
+    # zstd compressed files can only be written if zstandard is installed
+    if config.compress == 'zstd' and zstandard is None:
+        print()
+        print('zstandard is not installed, using gzip to compress the combined files instead')
+        config = config.replace(compress='gzip')
+
+    return config
+
+
+def run(result_path, output_path, config=None):
+    """This function processes a single result folder.
+
+    It doesn't ask the user anything, so it can also be used to process multiple folders in a row. All state of the
+    run is kept in a RunContext, so multiple folders can also be processed at the same time in different threads. If
+    the processing fails, a FixationError is raised with the exit code of the problem.
+
+    :param result_path: The folder containing the Fixation files
+    :param output_path: The folder to write the output to
+    :param config: The FixationConfig with the settings of this run, the default settings if not given
+    :return:
+    """
+    started = _timer()
 
     # Check if we can write to the result directory
-    if not check_path_writable_executable(_result_path):
+    if not check_path_writable_executable(result_path):
         print()
         print("Could not write to the results directory. Please check the permissions for that folder or ask for help")
-        safe_exit(3)
+        raise FixationError('Could not write to {}'.format(result_path), 3)
+
+    context = RunContext(result_path, output_path, usable_config(config or FixationConfig()))
+    config = context.config
+
+    # Scan the result folder again, as its files could have changed since a previous run. All steps of this run share
+    # that scan
+    forget_folder(result_path)
 
     # Check if there are agc files present. Put in a variable beforehand because of performance reasons
-    if does_folder_contain_files('.agc', _result_path):
-        _agc_present = True
+    context.agc_present = does_folder_contain_files('.agc', result_path)
 
     # Check if there are ags files present. Put in a variable beforehand because of consistency
-    if does_folder_contain_files('.ags', _result_path):
-        _ags_present = True
+    context.ags_present = does_folder_contain_files('.ags', result_path)
 
-    # Start the processing
-    print()
-    print('----- Processing individual JNF and agc files -----')
-    process_jnf_agc_files()
+    # When resuming, load the participants finished by the interrupted run
+    context.journal_entries = load_journal(output_path) if config.resume else {}
+
+    # When processing incrementally, load the description of the previous run
+    if config.incremental:
+        context.previous_manifest = load_manifest(output_path)
+
+        # The participants finished by the interrupted run count as processed in the previous run. Only entries with
+        # hashes can be used, as the manifest compares the hashes of the files
+        for short_filename, entry in context.journal_entries.items():
+            if all(entry.get(x) and entry[x]['hash'] is not None for x in ('jnf', 'agc', 'act')):
+                context.previous_manifest['participants'][short_filename] = entry
+
+    # Keep a journal of the finished participants, so that this run can be resumed if it's stopped
+    context.journal = open_journal(output_path, config.resume)
+
+    # Profile the processing if asked for. The reports are also written if the processing fails, as they are most
+    # needed then
+    profiler = start_profiling(context)
+
+    try:
+        # Start the processing
+        print()
+        print('----- Processing individual JNF and agc files -----')
+        process_jnf_agc_files(context)
+
+        print('----- Combining act files -----')
+        combine_act_files(context)
+
+        print('----- Combining ags files -----')
+        combine_ags_files(context)
+    finally:
+        context.journal.close()
+        finish_profiling(context, profiler)
+
+        # The scan of the result folder is only used by this run
+        forget_folder(result_path)
 
-    print('----- Combining act files -----')
-    combine_act_files()
+    # Describe this run for the next incremental run
+    if config.incremental:
+        save_manifest(output_path, context.manifest)
 
-    print('----- Combining ags files -----')
-    combine_ags_files()
+    # The run is complete, so there is nothing to resume
+    os.remove(os.path.join(output_path, _journal_filename))
+
+    # Write the run report
+    if config.report is not None:
+        write_report(os.path.join(output_path, 'fixation_report.' + config.report), config.report, context, started)
+
+    print()
+    print('Split imgfiles: {lookups} lookups, {hits} cache hits, {misses} cache misses'.format(
+        **context.imgfile_cache.stats()))
 
     print()
     print('----- Done! -----')
 
+
+def run_folder(folder, config):
+    """This function processes a result folder without asking the user anything, writing the output to that folder.
+
+    Any unexpected error only stops the processing of this folder. It is reported with its traceback, and the exit
+    code is then 1, like the exit code of a Python script that stops because of an error.
+
+    :param folder: The result folder to process
+    :param config: The FixationConfig with the settings of the run
+    :return: The exit code: 0 if the folder was processed, 5 if it doesn't contain Fixation files, or the exit code of
+             the problem that stopped the processing
+    """
+    print()
+    print('===== Processing {} ====='.format(folder))
+
+    if not os.path.isdir(folder) or not check_if_valid_path(folder):
+        print()
+        print('We couldn\'t find Fixation files in this folder, skipping it')
+        return 5
+
+    try:
+        run(folder, folder, config)
+    except FixationError as e:
+        # The problem is already explained
+        return e.code
+    except Exception:
+        print()
+        print('Processing {} stopped because of an unexpected error:'.format(folder))
+        traceback.print_exc(file=sys.stdout)
+        return 1
+
+    return 0
+
+
+def run_folder_job(job):
+    """This function runs run_folder in a process of the process pool.
+
+    The participants of the folder are processed one by one, as a process of a pool can't have a pool of its own.
+
+    :param job: A tuple with the folder and the FixationConfig with the settings of the run
+    :return: The exit code of run_folder
+    """
+    folder, config = job
+
+    return run_folder(folder, config.replace(jobs=1))
+
+
+def run_batch(folders, merge_path=None, config=None):
+    """This function processes multiple result folders, without asking the user anything.
+
+    The output of every folder is written to that folder. If a folder fails, the other folders are still processed.
+    When more than one job is used, the folders are processed in parallel by a pool of processes.
+
+    :param folders: The result folders to process
+    :param merge_path: If given, the combined files of all folders are merged into study files in this folder
+    :param config: The FixationConfig with the settings of the runs, the default settings if not given
+    :return: 0 if all folders were processed, otherwise the exit code of the first folder that failed
+    """
+    # Check the dependencies once, instead of for every folder. The study files are then written like the folders
+    config = usable_config(config or FixationConfig())
+
+    if config.jobs != 1 and len(folders) > 1:
+        pool = multiprocessing.Pool(config.jobs or None, init_participant_process)
+        try:
+            exit_codes = pool.map(run_folder_job, [(folder, config) for folder in folders])
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        exit_codes = [run_folder(folder, config) for folder in folders]
+
+    # Merge the output of the folders that were processed
+    if merge_path is not None:
+        merge_folders([x for x, exit_code in zip(folders, exit_codes) if exit_code == 0], merge_path, config)
+
+    # Give an overview of all folders
+    print()
+    print('===== Summary =====')
+    for folder, exit_code in zip(folders, exit_codes):
+        print('{}: {}'.format(folder, 'done' if exit_code == 0 else 'failed with exit code {}'.format(exit_code)))
+
+    return next((x for x in exit_codes if x != 0), 0)
+
+
+def folder_label(folder):
+    """Returns the name of a folder as used in the folder column of the study files, which can't contain spaces.
+
+    The name is relative to the current directory. On Windows, a folder on another drive has no relative path, so its
+    absolute path is used then.
+
+    :param folder: The result folder
+    :return: The name of the folder
+    """
+    try:
+        label = os.path.relpath(folder)
+    except ValueError:
+        label = os.path.abspath(folder)
+
+    return re.sub(r'\s', '_', label.replace(os.sep, '/'))
+
+
+def merge_folders(folders, output_path, config):
+    """This function merges the combined files of multiple result folders into studyACTFiles.txt and studyAGSFiles.txt.
+
+    Every line gets an extra first column with the folder it came from. If the folders have an allAGSSummary.txt, they
+    are merged into studyAGSSummary.txt as well.
+
+    :param folders: The processed result folders, containing their combined files
+    :param output_path: The folder to write the study files to
+    :param config: The FixationConfig the folders were processed with
+    :return:
+    """
+    extension = _compression_extensions.get(config.compress, '')
+
+    for filename, header in [('allACTFiles.txt', all_act_header(config.extra_metrics)),
+                             ('allAGSFiles.txt', _all_ags_header), ('allAGSSummary.txt', _ags_summary_header)]:
+        paths = [(folder, os.path.join(folder, filename + extension)) for folder in folders]
+        paths = [(folder, path) for folder, path in paths if os.path.exists(path)]
+        if not paths:
+            continue
+
+        study_filename = 'study' + filename[3:]
+        print()
+        print('Merging {}'.format(study_filename))
+
+        with open_file(os.path.join(output_path, study_filename + extension), 'w') as output_file:
+            output_file.write('folder ' + header)
+
+            for folder, path in paths:
+                prefix = folder_label(folder) + ' '
+                with open_file(path) as f:
+                    for lines in read_line_chunks(f):
+                        output_file.write(prefix + ('\n' + prefix).join(lines) + '\n')
+
+        print('Created {}'.format(study_filename))
+
+
+# These parameters are used in the testcases
+def main(result_path=None, output_path=None, config=None):
+    """Main function that starts all the magic.
+
+    It is called at the end of this file.
+    :return:
+    """
+    # Check if the paths were supplied
+    if result_path is None and output_path is None:
+        # Setup the argument parser
+        args = arg_parse()
+
+        config = FixationConfig(engine=args.engine, lenient=args.lenient, extra_metrics=args.extra_metrics,
+                                stream=args.stream, jobs=args.jobs, incremental=args.incremental, report=args.report,
+                                columnar=args.columnar, compress=args.compress, pipeline=args.pipeline,
+                                resume=args.resume, ags_summary=args.ags_summary, profile=args.profile,
+                                trace_memory=args.trace_memory)
+
+        # In batch mode, process all given folders without asking anything
+        if args.batch:
+            sys.exit(run_batch(args.batch, (args.output or '.') if args.merge else None, config))
+
+        # Or all folders containing Fixation files
+        if args.all:
+            folders = sorted(find_result_folders(args.path or '.'))
+            if not folders:
+                print('We couldn\'t find a folder containing your Fixation result files.')
+                sys.exit(5)
+            sys.exit(run_batch(folders, (args.output or '.') if args.merge else None, config))
+
+        # If a path is supplied through the arguments and is valid
+        if args.path is not None and check_if_valid_path(args.path):
+            result_path = args.path
+        else:
+            # Otherwise, resolve the result path we need to use
+            print('-----  Trying to autodetect result folder(s) containing Fixation output files -----')
+            print()
+            autodetect_result_path()
+            result_path = _result_path
+
+        # If an output path is supplied through the arguments and is valid
+        if args.output is not None and check_path_writable_executable(args.output):
+            output_path = args.output
+        else:
+            # Otherwise, default to the result path
+            output_path = result_path
+
+    try:
+        run(result_path, output_path, config)
+    except FixationError as e:
+        # The problem is already explained to the user, stop with its exit code
+        safe_exit(e.code)
+
     safe_exit()
 
 
 # Only run if this file is executed by itself
 if __name__ == '__main__':
 
-    # If this is Linux, and we are not running through a terminal, open a terminal and execute there.
-    if (sys.platform == "linux2" or sys.platform == "linux") and not sys.stdout.isatty():
+    # If this is Linux, and we are not running through a terminal, open a terminal and execute there. Batch mode is
+    # meant to run without a terminal, so it's not needed then.
+    if (sys.platform == "linux2" or sys.platform == "linux") and not sys.stdout.isatty() and \
+            '--batch' not in sys.argv and '--all' not in sys.argv:
         # List of supported terminal emulators
         terminals = ['gnome-terminal', 'mate-terminal', 'xfce4-terminal', 'lxterminal', 'rxvt-unicode', 'rxvt', 'xterm']
 
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import pytest
+from py._path.local import LocalPath
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+import benchmark
+import process_fixation_output
+
+
+def test_generated_data(tmpdir: LocalPath):
+    """The generated data should be processed by the script without problems
+
+    :param tmpdir:
+    :return:
+    """
+    data_path = tmpdir.mkdir('data').__str__()
+    benchmark.generate_data(data_path, 2, 3, 5, 4, 20)
+
+    process_fixation_output._safe_exit = False
+    with pytest.raises(SystemExit) as e:
+        process_fixation_output.main(data_path, tmpdir.mkdir('output').__str__())
+
+    assert e.value.code == 0, "Exit code is not 0"
+
+
+def test_run_benchmark(tmpdir: LocalPath):
+    """The benchmark should time every stage, and count the rows it processed
+
+    :param tmpdir:
+    :return:
+    """
+    data_path = tmpdir.mkdir('data').__str__()
+    benchmark.generate_data(data_path, 2, 3, 5, 4, 20)
+
+    results = benchmark.run_benchmark(data_path, tmpdir.mkdir('output').__str__())
+
+    for stage in ['sort_jnf_file', 'make_trt', 'make_act', 'combine_act_files', 'combine_ags_files']:
+        assert stage in results, "{} was not timed".format(stage)
+    assert results['make_trt']['rows'] == 2 * 3 * 5
+    assert results['make_act']['rows'] == 2 * 3 * 4
+    assert results['combine_ags_files']['rows'] == 2 * 3 * 20
+
+
+def test_compare_results():
+    """Only stages that got slower than the tolerance should be reported"""
+    baseline = {'make_trt': {'seconds': 1.0}, 'make_act': {'seconds': 1.0}}
+    results = {'make_trt': {'seconds': 1.1}, 'make_act': {'seconds': 1.5}, 'make_trt_numpy': {'seconds': 9.0}}
+
+    assert benchmark.compare_results(results, baseline, 0.2) == ['make_act']
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import pytest
+import shutil
 from py._path.local import LocalPath
 import sys
 import os
@@ -92,8 +93,105 @@ def test_check_number_columns_in_row_3():
 
 
 def test_check_number_columns_in_row_4():
-    """check_number_columns_in_row should exit the programme with a list of 5 items and a supposed length of
-    4 and hard_fail true"""
+    """check_number_columns_in_row should raise a FixationError with a list of 5 items and a supposed length
+    of 4 and hard_fail true"""
     row = ['a', 'b', 'c', 'd', 'e']
-    with pytest.raises(SystemExit):
+    with pytest.raises(p.FixationError) as e:
         p.check_number_columns_in_row(row, 4, True)
+    assert e.value.code == 4, "Exit code is not 4"
+
+
+def test_imgfile_splits():
+    """ImgfileSplits should split imgfiles into cond and item only once, and remember badly formatted imgfiles"""
+    splits = p.ImgfileSplits(max_size=2)
+
+    assert splits['A000.BMP'] == 'A 000'
+    assert splits['A000.BMP'] == 'A 000'
+    assert splits['WRONG.BMP'] is None
+    assert splits.misses == 2, "Imgfiles should only be split the first time they are looked up"
+
+    # When the maximum size is reached, the dict should start over
+    assert splits['B001.BMP'] == 'B 001'
+    assert len(splits) == 1
+
+
+def test_list_files(tmpdir: LocalPath):
+    for file in ['b.ags.gz', 'a.ags', 'a.ags.gz', 'c.AGS.zst', 'c.agc']:
+        tmpdir.join(file).write('')
+
+    assert p.list_files(tmpdir.__str__(), '.ags') == ['a.ags', 'b.ags.gz', 'c.AGS.zst'], \
+        "Compressed files should be listed, unless they also exist uncompressed"
+    assert p.does_folder_contain_files('.agc', tmpdir.__str__())
+    assert p.find_file(tmpdir.__str__(), 'b.ags') == os.path.join(tmpdir.__str__(), 'b.ags.gz')
+
+
+def test_read_rows(tmpdir: LocalPath):
+    tmpdir.join('test.agc').write_binary(b'expname a b\r\nTST 1 2\r\nTST 3 4')
+    tmpdir.join('empty.agc').write_binary(b'')
+
+    assert p.read_rows(tmpdir.join('test.agc').__str__()) == [['TST', '1', '2'], ['TST', '3', '4']]
+    assert p.read_rows(tmpdir.join('empty.agc').__str__()) == []
+    assert list(p.iter_columns(tmpdir.join('test.agc').__str__(), 0)) == \
+        [(3, [b'TST', b'1 2']), (3, [b'TST', b'3 4'])], "Rows should only be split up to the last needed column"
+
+
+def test_jnf_rows():
+    rows = p.JnfRows()
+    rows.append('B001.BMP', 2, 100, 10, 20, 0)
+    rows.append('A000.BMP', 12, 200, 30, 40, 1)
+    rows.append('A000.BMP', 3, -5, 50, 60, 0)
+
+    sorted_rows = rows.sorted()
+    assert len(sorted_rows) == 3
+    assert list(sorted_rows) == [('A000.BMP', 3, -5, 50, 60, 0), ('A000.BMP', 12, 200, 30, 40, 1),
+                                 ('B001.BMP', 2, 100, 10, 20, 0)], "Codes should be sorted as numbers"
+    assert sorted_rows.imgfiles[0] is sorted_rows.imgfiles[1], "Every imgfile should only be stored once"
+
+
+def test_scan_folder(tmpdir: LocalPath):
+    session = tmpdir.mkdir('exp').mkdir('session 1')
+    for file in ['pp1.JNF', 'pp1.agc', 'pp1.ags.gz']:
+        session.join(file).write('')
+    tmpdir.mkdir('empty').join('notes.txt').write('')
+
+    assert p.find_result_folders(tmpdir.__str__()) == [session.__str__()]
+
+    # The scan should be kept until the folder is forgotten
+    session.join('pp2.JNF').write('')
+    assert p.list_files(session.__str__(), '.jnf') == ['pp1.JNF']
+    p.forget_folder(session.__str__())
+    assert p.list_files(session.__str__(), '.jnf') == ['pp1.JNF', 'pp2.JNF']
+    assert p.scan_folder(session.__str__()).groups['.ags'] == ['pp1.ags.gz']
+
+
+def test_scan_folder_bounded(tmpdir: LocalPath, monkeypatch):
+    """The kept folder scans should be emptied when there are too many, and a run should forget the scan of its folder
+    """
+    monkeypatch.setattr(p, '_folder_scans', {})
+    monkeypatch.setattr(p, '_max_folder_scans', 3)
+    for number in range(10):
+        p.scan_folder(tmpdir.mkdir('folder{}'.format(number)).__str__())
+        assert len(p._folder_scans) <= 3, "Too many folder scans are kept"
+
+    # Only the scans of result folders are kept
+    p._folder_scans.clear()
+    assert p.find_result_folders(tmpdir.__str__()) == []
+    assert not p._folder_scans
+
+    result_path = tmpdir.join('result').__str__()
+    shutil.copytree('test_cases/correct', result_path)
+    p.run(result_path, result_path)
+    assert not p._folder_scans, "The scan of the result folder was kept after the run"
+
+
+def test_folder_label_other_drive(tmpdir: LocalPath, monkeypatch):
+    """A folder without a relative path, like a folder on another drive on Windows, should be labeled by its absolute
+    path"""
+    folder = tmpdir.mkdir('session 1').__str__()
+    assert p.folder_label(folder) == os.path.relpath(folder).replace(os.sep, '/').replace(' ', '_')
+
+    def relpath(path, start=os.curdir):
+        raise ValueError('path is on mount \'D:\', start on mount \'C:\'')
+
+    monkeypatch.setattr(os.path, 'relpath', relpath)
+    assert p.folder_label(folder) == os.path.abspath(folder).replace(os.sep, '/').replace(' ', '_')
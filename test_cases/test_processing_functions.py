@@ -5,6 +5,10 @@ import os
 sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
 import process_fixation_output
 import filecmp
+import shutil
+import json
+import subprocess
+import threading
 
 
 def test_all1(tmpdir: LocalPath):
@@ -67,3 +71,1005 @@ def test_run_with_invalid_path():
         process_fixation_output.main('/')
 
     assert e.value.code == 3, "Exit code is not 3"
+
+
+def test_stream(tmpdir: LocalPath, monkeypatch):
+    """Streaming act files to allACTFiles.txt while processing should give the exact same output as combining them
+    afterwards. No act files should be kept in memory.
+
+    :param tmpdir:
+    :param monkeypatch:
+    :return:
+    """
+    contexts = []
+    run_context = process_fixation_output.RunContext
+
+    class RecordedRunContext(run_context):
+        def __init__(self, *args):
+            run_context.__init__(self, *args)
+            contexts.append(self)
+
+    monkeypatch.setattr(process_fixation_output, 'RunContext', RecordedRunContext)
+    process_fixation_output._safe_exit = False
+    config = process_fixation_output.FixationConfig(stream=True)
+    with pytest.raises(SystemExit) as e:
+        process_fixation_output.main('test_cases/correct/', tmpdir.__str__(), config)
+
+    assert e.value.code == 0, "Exit code is not 0"
+    assert not contexts[0].act_files, "Act files were kept in memory while streaming"
+    assert filecmp.cmp('test_cases/correct/allACTFiles.txt', tmpdir.__str__() + '/allACTFiles.txt', False), \
+        "Output files are not identical!"
+    for i in range(1, 6):
+        assert filecmp.cmp('test_cases/correct/test{}.act'.format(i), tmpdir.__str__() + '/test{}.act'.format(i),
+                           False), "Output files are not identical!"
+
+
+def test_jobs(tmpdir: LocalPath):
+    """Processing the files with multiple processes should give the exact same output as processing them one by one.
+
+    :param tmpdir:
+    :return:
+    """
+    process_fixation_output._safe_exit = False
+    config = process_fixation_output.FixationConfig(jobs=3)
+    with pytest.raises(SystemExit) as e:
+        process_fixation_output.main('test_cases/correct/', tmpdir.__str__(), config)
+
+    assert e.value.code == 0, "Exit code is not 0"
+    assert filecmp.cmp('test_cases/correct/allACTFiles.txt', tmpdir.__str__() + '/allACTFiles.txt', False), \
+        "Output files are not identical!"
+
+
+def test_jobs_malformed_agc(tmpdir: LocalPath):
+    """A malformed AGC file should also give exit code 4 when it's processed in a different process.
+
+    :param tmpdir:
+    :return:
+    """
+    for name in ['test1.JNF', 'test1.agc', 'test2.JNF', 'test2.agc']:
+        shutil.copy(os.path.join('test_cases/correct', name), tmpdir.__str__())
+    shutil.copy('test_cases/malformed_agc/test1.JNF', os.path.join(tmpdir.__str__(), 'test3.JNF'))
+    shutil.copy('test_cases/malformed_agc/test1.agc', os.path.join(tmpdir.__str__(), 'test3.agc'))
+
+    process_fixation_output._safe_exit = False
+    with pytest.raises(SystemExit) as e:
+        process_fixation_output.main(tmpdir.__str__(), tmpdir.__str__(), process_fixation_output.FixationConfig(jobs=2))
+
+    assert e.value.code == 4, "Exit code is not 4"
+
+
+def test_make_act_code_not_a_number(tmpdir: LocalPath):
+    """An agc line with a code that isn't a number should stop the script with exit code 4"""
+    with open('test_cases/correct/test1.agc') as f:
+        lines = f.readlines()
+    columns = lines[1].split(' ')
+    columns[5] = 'abc'
+    lines.append(' '.join(columns))
+    agc = os.path.join(tmpdir.__str__(), 'test1.agc')
+    with open(agc, 'w') as f:
+        f.writelines(lines)
+
+    trt = process_fixation_output.make_trt(process_fixation_output.sort_jnf_file('test_cases/correct/test1.JNF'))
+    with pytest.raises(process_fixation_output.FixationError) as e:
+        process_fixation_output.make_act(trt, agc)
+
+    assert e.value.code == 4, "Exit code is not 4"
+
+
+def test_make_trt_numpy():
+    """The numpy engine should calculate the exact same TRT as the python engine"""
+    pytest.importorskip('numpy')
+
+    for i in range(1, 6):
+        file = 'test_cases/correct/test{}.JNF'.format(i)
+        assert process_fixation_output.make_trt_numpy(file) == \
+            process_fixation_output.make_trt(process_fixation_output.sort_jnf_file(file)), \
+            "The numpy TRT is not identical to the python TRT!"
+
+
+def test_make_trt_hashed(tmpdir: LocalPath):
+    """The hash engine should calculate the exact same TRT as the python engine, also for negative fixations"""
+    # Add a line with a negative fixation to the test data
+    with open('test_cases/correct/test1.JNF') as f:
+        lines = f.readlines()
+    columns = lines[1].split(' ')
+    columns[10] = '-25'
+    lines.append(' '.join(columns))
+    negative_file = os.path.join(tmpdir.__str__(), 'negative.JNF')
+    with open(negative_file, 'w') as f:
+        f.writelines(lines)
+
+    files = ['test_cases/correct/test{}.JNF'.format(i) for i in range(1, 6)] + [negative_file]
+    for file in files:
+        assert process_fixation_output.make_trt_hashed(file) == \
+            process_fixation_output.make_trt(process_fixation_output.sort_jnf_file(file)), \
+            "The hashed TRT is not identical to the python TRT!"
+
+
+def test_make_trt_non_ascii_imgfile(tmpdir: LocalPath, monkeypatch):
+    """An imgfile with a character that isn't ASCII should be decoded in the encoding open() uses, like in the agc file
+
+    :param tmpdir:
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(process_fixation_output, '_text_encoding', 'cp1252')
+    with open('test_cases/correct/test1.JNF') as f:
+        lines = f.readlines()
+    non_ascii_file = os.path.join(tmpdir.__str__(), 'non_ascii.JNF')
+    with open(non_ascii_file, 'wb') as f:
+        f.write(''.join(lines).replace('A000.BMP', '\xe9000.BMP').encode('cp1252'))
+
+    trt = process_fixation_output.make_trt_hashed(non_ascii_file)
+    assert trt == process_fixation_output.make_trt(process_fixation_output.sort_jnf_file(non_ascii_file)), \
+        "The hashed TRT is not identical to the python TRT!"
+    assert sorted(trt) == sorted((name.replace('A000.BMP', '\xe9000.BMP'), code) for name, code in
+                                 process_fixation_output.make_trt_hashed('test_cases/correct/test1.JNF'))
+
+
+def test_make_trt_colliding_keys():
+    """Imgfile and code combinations that read the same when put together should get their own TRT entry"""
+    rows = process_fixation_output.JnfRows()
+    rows.append('A1', 23, 100, 0, 0, 0)
+    rows.append('A12', 3, 200, 0, 0, 1)
+
+    trt = process_fixation_output.make_trt(rows.sorted())
+    assert trt[('A1', 23)] == (100, 1, 0, 100, 1)
+    assert trt[('A12', 3)] == (200, 1, 1, 0, 0)
+
+
+@pytest.mark.parametrize('engine', ['python', 'hash', 'numpy'])
+def test_make_trt_extra_metrics(tmpdir: LocalPath, engine):
+    """The extra metrics should add the saccade totals and the first and second pass durations to the TRT, and all
+    engines should calculate the same extra metrics"""
+    if engine == 'numpy':
+        pytest.importorskip('numpy')
+
+    def make_trt(file):
+        if engine == 'hash':
+            return process_fixation_output.make_trt_hashed(file, extended=True)
+        if engine == 'numpy':
+            return process_fixation_output.make_trt_numpy(file, extended=True)
+        return process_fixation_output.make_trt(process_fixation_output.sort_jnf_file(file, extended=True), True)
+
+    # Region 1 is read, then region 2, and then region 1 again
+    with open('test_cases/correct/test1.JNF') as f:
+        header, line = f.readlines()[:2]
+    columns = line.split(' ')
+    lines = [header]
+    for code, fixdur, sacc_in, sacc_out, qual in [(1, 100, 10, 20, 0), (1, 150, 30, 40, 1), (2, 200, 50, 60, 0),
+                                                  (1, 300, 70, 80, 0)]:
+        columns[29], columns[10], columns[11], columns[12], columns[13] = \
+            str(code), str(fixdur), str(sacc_in), str(sacc_out), str(qual)
+        lines.append(' '.join(columns))
+    file = os.path.join(tmpdir.__str__(), 'passes.JNF')
+    with open(file, 'w') as f:
+        f.writelines(lines)
+
+    trt = make_trt(file)
+    assert trt[(columns[1], 1)] == (550, 3, 1, 400, 2, 110, 140, 80, 100, 250, 300)
+    assert trt[(columns[1], 2)] == (200, 1, 0, 200, 1, 50, 60, 50, 60, 200, 0)
+
+    for i in range(1, 6):
+        file = 'test_cases/correct/test{}.JNF'.format(i)
+        trt = make_trt(file)
+        assert trt == process_fixation_output.make_trt(process_fixation_output.sort_jnf_file(file, extended=True),
+                                                       True), "The extra metrics differ between the engines!"
+        assert dict((key, values[:5]) for key, values in trt.items()) == \
+            process_fixation_output.make_trt(process_fixation_output.sort_jnf_file(file)), \
+            "The extra metrics should not change the other TRT values"
+
+
+@pytest.mark.filterwarnings('ignore:loadtxt')
+@pytest.mark.parametrize('extended', [False, True])
+def test_make_trt_header_only(tmpdir: LocalPath, extended):
+    """All engines should give an empty TRT for a JNF file with only the column headers"""
+    file = os.path.join(tmpdir.__str__(), 'empty.JNF')
+    with open('test_cases/correct/test1.JNF') as f:
+        header = f.readline()
+    with open(file, 'w') as f:
+        f.write(header)
+
+    assert process_fixation_output.make_trt(process_fixation_output.sort_jnf_file(file, extended=extended),
+                                            extended) == {}
+    assert process_fixation_output.make_trt_hashed(file, extended=extended) == {}
+    if process_fixation_output.numpy is not None:
+        assert process_fixation_output.make_trt_numpy(file, extended=extended) == {}
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_extra_metrics(tmpdir: LocalPath, incremental):
+    """With the extra metrics, the act files should get six extra columns after the usual TRT values
+
+    :param tmpdir:
+    :param incremental:
+    :return:
+    """
+    config = process_fixation_output.FixationConfig(incremental=incremental)
+    if incremental:
+        # An incremental run without the extra metrics should be redone completely when they are turned on
+        assert run_main('test_cases/correct/', tmpdir.__str__(), config) == 0, "Exit code is not 0"
+    config = config.replace(extra_metrics=True)
+    assert run_main('test_cases/correct/', tmpdir.__str__(), config) == 0, "Exit code is not 0"
+
+    with open('test_cases/correct/allACTFiles.txt') as f:
+        expected = [line.split() for line in f]
+    with open(os.path.join(tmpdir.__str__(), 'allACTFiles.txt')) as f:
+        lines = [line.split() for line in f]
+
+    assert lines[0] == expected[0] + ['totsaccindur', 'totsaccoutdur', 'totsaccinQual0dur', 'totsaccoutQual0dur',
+                                      'firstpassdur', 'secondpassdur']
+    assert [line[:-6] for line in lines] == expected, "The extra metrics should not change the other columns"
+    assert all(int(line[-6]) + int(line[-5]) >= int(line[-4]) + int(line[-3]) for line in lines[1:])
+    assert all(int(line[-2]) + int(line[-1]) == int(line[-11]) for line in lines[1:]), \
+        "The first and second pass should add up to totfixdur"
+
+    with open(os.path.join(tmpdir.__str__(), 'test1.act')) as f:
+        assert len(f.readline().split()) == 39
+
+
+def run_main(*args):
+    """Runs the script with the given paths and FixationConfig, and returns the exit code"""
+    process_fixation_output._safe_exit = False
+    with pytest.raises(SystemExit) as e:
+        process_fixation_output.main(*args)
+
+    return e.value.code
+
+
+def test_incremental(tmpdir: LocalPath):
+    """An incremental run should only process the changed files, and give the same output as a complete run.
+
+    :param tmpdir:
+    :return:
+    """
+    result_path = tmpdir.mkdir('result').__str__()
+    output_path = tmpdir.mkdir('output').__str__()
+    reference_path = tmpdir.mkdir('reference').__str__()
+    for i in range(1, 6):
+        for extension in ['JNF', 'agc', 'ags']:
+            shutil.copy('test_cases/correct/test{}.{}'.format(i, extension), result_path)
+
+    config = process_fixation_output.FixationConfig(incremental=True)
+
+    # The first run should process everything
+    assert run_main(result_path, output_path, config) == 0, "Exit code is not 0"
+    assert filecmp.cmp('test_cases/correct/allACTFiles.txt', output_path + '/allACTFiles.txt', False), \
+        "Output files are not identical!"
+    assert filecmp.cmp('test_cases/correct/allAGSFiles.txt', output_path + '/allAGSFiles.txt', False), \
+        "Output files are not identical!"
+
+    # Change the files of one participant
+    for extension in ['agc', 'ags']:
+        with open(os.path.join(result_path, 'test2.' + extension)) as f:
+            lines = f.readlines()
+        with open(os.path.join(result_path, 'test2.' + extension), 'w') as f:
+            f.writelines(lines[:-10])
+    unchanged_act_mtime = os.path.getmtime(output_path + '/test1.act')
+
+    # The second run should only process the changed participant
+    assert run_main(result_path, output_path, config) == 0, "Exit code is not 0"
+    assert os.path.getmtime(output_path + '/test1.act') == unchanged_act_mtime, \
+        "An unchanged act file was rewritten"
+
+    # A run without changes should keep all output files
+    combined_mtime = os.path.getmtime(output_path + '/allAGSFiles.txt')
+    assert run_main(result_path, output_path, config) == 0, "Exit code is not 0"
+    assert os.path.getmtime(output_path + '/allAGSFiles.txt') == combined_mtime, "allAGSFiles.txt was rewritten"
+
+    # The output should be the same as the output of a complete run
+    assert run_main(result_path, reference_path) == 0, "Exit code is not 0"
+    for file in ['allACTFiles.txt', 'allAGSFiles.txt', 'test2.act']:
+        assert filecmp.cmp(os.path.join(reference_path, file), os.path.join(output_path, file), False), \
+            "Output files are not identical!"
+
+
+def test_add_ags_file_chunks(tmpdir: LocalPath):
+    """Adding an ags file in chunks should give the same lines as processing all lines with
+    process_combined_file_lines, also for chunks that can't be processed at once.
+
+    :param tmpdir:
+    :return:
+    """
+    with open('test_cases/correct/test1.ags') as f:
+        lines = f.readlines()
+    # Add an empty line halfway and remove the newline at the end of the file
+    lines.insert(500, '\n')
+    lines[-1] = lines[-1].rstrip('\n')
+    ags_file = os.path.join(tmpdir.__str__(), 'test.ags')
+    with open(ags_file, 'w') as f:
+        f.writelines(lines)
+
+    expected_file = os.path.join(tmpdir.__str__(), 'expected.txt')
+    with open(expected_file, 'w') as f:
+        process_fixation_output.process_combined_file_lines(
+            [x.replace('\n', '').split(' ') for x in lines if not x.startswith('expname')], 1, f)
+
+    chunk_size = process_fixation_output._ags_chunk_size
+    process_fixation_output._ags_chunk_size = 1000
+    try:
+        output_file = os.path.join(tmpdir.__str__(), 'output.txt')
+        with open(output_file, 'w') as f:
+            context = process_fixation_output.RunContext(tmpdir.__str__(), tmpdir.__str__(),
+                                                         process_fixation_output.FixationConfig())
+            assert process_fixation_output.add_ags_file(context, ags_file, f) == len(lines) - 1, \
+                "Wrong number of lines added"
+    finally:
+        process_fixation_output._ags_chunk_size = chunk_size
+
+    assert filecmp.cmp(expected_file, output_file, False), "Output files are not identical!"
+
+
+def test_report(tmpdir: LocalPath):
+    """The run report should contain a record of every stage for every participant
+
+    :param tmpdir:
+    :return:
+    """
+    config = process_fixation_output.FixationConfig(report='json')
+    assert run_main('test_cases/correct/', tmpdir.__str__(), config) == 0, "Exit code is not 0"
+
+    with open(os.path.join(tmpdir.__str__(), 'fixation_report.json')) as f:
+        report = json.load(f)
+
+    for stage in ['sort_jnf_file', 'make_trt', 'make_act', 'write_act', 'combine_act_files', 'combine_ags_files']:
+        assert report['totals'][stage]['count'] == 5, "Not every participant has a record for {}".format(stage)
+    assert report['totals']['sort_jnf_file']['rows_read'] == 500
+    assert report['totals']['combine_ags_files']['rows_written'] == 60000
+    ags_size = os.path.getsize(os.path.join(tmpdir.__str__(), 'allAGSFiles.txt'))
+    assert report['totals']['combine_ags_files']['bytes_written'] == \
+        ags_size - len(process_fixation_output._all_ags_header)
+
+    # The memory of a stage is how much it raised the peak memory of the process, which never goes down
+    if report['process_peak_memory'] is not None:
+        peaks = [record['process_peak_memory'] for record in report['stages']]
+        assert peaks == sorted(peaks)
+        assert all(0 <= record['peak_memory_growth'] <= record['process_peak_memory'] for record in report['stages'])
+        assert sum(record['peak_memory_growth'] for record in report['stages']) <= report['process_peak_memory']
+    assert all(record['traced_peak_memory'] is None for record in report['stages'])
+
+
+def test_report_csv(tmpdir: LocalPath):
+    """The csv run report should contain a line for every stage for every participant
+
+    :param tmpdir:
+    :return:
+    """
+    config = process_fixation_output.FixationConfig(report='csv')
+    assert run_main('test_cases/correct/', tmpdir.__str__(), config) == 0, "Exit code is not 0"
+
+    with open(os.path.join(tmpdir.__str__(), 'fixation_report.csv')) as f:
+        lines = f.readlines()
+
+    assert lines[0].startswith('stage,participant,seconds'), "The csv report has no header"
+    assert len(lines) == 1 + 6 * 5, "The csv report doesn't have a line for every stage"
+
+
+def test_batch(tmpdir: LocalPath):
+    """Batch mode should process all folders without asking anything, also when a folder fails. The exit code should
+    be the exit code of the first folder that failed.
+
+    :param tmpdir:
+    :return:
+    """
+    correct_path = os.path.join(tmpdir.__str__(), 'correct')
+    malformed_path = os.path.join(tmpdir.__str__(), 'malformed_ags')
+    shutil.copytree('test_cases/correct', correct_path)
+    shutil.copytree('test_cases/malformed_ags', malformed_path)
+    os.remove(os.path.join(correct_path, 'allACTFiles.txt'))
+    os.remove(os.path.join(correct_path, 'allAGSFiles.txt'))
+
+    # Run the script like a scheduled job would, without a terminal
+    script = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, 'process_fixation_output.py')
+    process = subprocess.Popen([sys.executable, script, '--batch', malformed_path, correct_path,
+                                os.path.join(tmpdir.__str__(), 'missing')],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate(timeout=60)[0].decode()
+
+    assert process.returncode == 2, "Exit code is not 2"
+    assert 'Press Enter' not in output, "Batch mode asked for input"
+    assert filecmp.cmp('test_cases/correct/allACTFiles.txt', os.path.join(correct_path, 'allACTFiles.txt'), False), \
+        "Output files are not identical!"
+    assert filecmp.cmp('test_cases/correct/allAGSFiles.txt', os.path.join(correct_path, 'allAGSFiles.txt'), False), \
+        "Output files are not identical!"
+
+
+@pytest.mark.parametrize('engine', ['python', 'hash', 'numpy'])
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_batch_malformed_jnf(tmpdir: LocalPath, engine, jobs):
+    """A JNF file with a fixdur that isn't a number should stop its folder with exit code 6, the other folders should
+    still be processed
+
+    :param tmpdir:
+    :param engine:
+    :param jobs:
+    :return:
+    """
+    if engine == 'numpy':
+        pytest.importorskip('numpy')
+
+    malformed_path = os.path.join(tmpdir.__str__(), 'b1')
+    correct_path = os.path.join(tmpdir.__str__(), 'b2')
+    shutil.copytree('test_cases/correct', malformed_path)
+    shutil.copytree('test_cases/correct', correct_path)
+    os.remove(os.path.join(correct_path, 'allACTFiles.txt'))
+
+    with open(os.path.join(malformed_path, 'test2.JNF')) as f:
+        lines = f.readlines()
+    columns = lines[-1].split(' ')
+    columns[10] = 'abc'
+    lines[-1] = ' '.join(columns)
+    with open(os.path.join(malformed_path, 'test2.JNF'), 'w') as f:
+        f.writelines(lines)
+
+    process_fixation_output._safe_exit = False
+    config = process_fixation_output.FixationConfig(engine=engine, jobs=jobs)
+    assert process_fixation_output.run_batch([malformed_path, correct_path], None, config) == 6, "Exit code is not 6"
+
+    assert filecmp.cmp('test_cases/correct/allACTFiles.txt', os.path.join(correct_path, 'allACTFiles.txt'), False), \
+        "Output files are not identical!"
+
+
+def test_batch_unexpected_error(tmpdir: LocalPath, monkeypatch):
+    """An unexpected error should only stop its own folder, with exit code 1
+
+    :param tmpdir:
+    :param monkeypatch:
+    :return:
+    """
+    correct_path = os.path.join(tmpdir.__str__(), 'correct')
+    shutil.copytree('test_cases/correct', correct_path)
+    os.remove(os.path.join(correct_path, 'allACTFiles.txt'))
+
+    combine_act_files = process_fixation_output.combine_act_files
+    calls = []
+
+    def failing_combine_act_files(context):
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError('Something unexpected')
+        combine_act_files(context)
+
+    monkeypatch.setattr(process_fixation_output, 'combine_act_files', failing_combine_act_files)
+    process_fixation_output._safe_exit = False
+    assert process_fixation_output.run_batch([correct_path, correct_path]) == 1, "Exit code is not 1"
+    assert filecmp.cmp('test_cases/correct/allACTFiles.txt', os.path.join(correct_path, 'allACTFiles.txt'), False), \
+        "The second folder should still be processed"
+
+
+def test_run_batch_missing_folder(tmpdir: LocalPath):
+    """Batch mode should give exit code 5 if a folder doesn't contain Fixation files
+
+    :param tmpdir:
+    :return:
+    """
+    assert process_fixation_output.run_batch([tmpdir.__str__()]) == 5, "Exit code is not 5"
+
+
+def test_run_threads(tmpdir: LocalPath):
+    """Multiple folders should be processable at the same time in different threads, every run keeping its own state
+
+    :param tmpdir:
+    :return:
+    """
+    folders = []
+    for number in range(4):
+        folder = os.path.join(tmpdir.__str__(), 'correct{}'.format(number))
+        shutil.copytree('test_cases/correct', folder)
+        os.remove(os.path.join(folder, 'allACTFiles.txt'))
+        folders.append(folder)
+    malformed_path = os.path.join(tmpdir.__str__(), 'malformed_agc')
+    shutil.copytree('test_cases/malformed_agc', malformed_path)
+    exit_codes = {}
+
+    def run(folder):
+        try:
+            process_fixation_output.run(folder, folder, process_fixation_output.FixationConfig(report='json'))
+            exit_codes[folder] = 0
+        except process_fixation_output.FixationError as e:
+            exit_codes[folder] = e.code
+
+    threads = [threading.Thread(target=run, args=(folder,)) for folder in folders + [malformed_path]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert exit_codes == dict([(folder, 0) for folder in folders] + [(malformed_path, 4)])
+    for folder in folders:
+        assert filecmp.cmp('test_cases/correct/allACTFiles.txt', os.path.join(folder, 'allACTFiles.txt'), False), \
+            "Output files are not identical!"
+        with open(os.path.join(folder, 'fixation_report.json')) as f:
+            report = json.load(f)
+        assert report['totals']['make_act']['count'] == 5, "The report contains the stages of other runs"
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_columnar(tmpdir: LocalPath, file_format):
+    """The columnar output should contain the same rows as the combined text files
+
+    :param tmpdir:
+    :param file_format:
+    :return:
+    """
+    pyarrow = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+
+    config = process_fixation_output.FixationConfig(columnar=file_format)
+    assert run_main('test_cases/correct/', tmpdir.__str__(), config) == 0, "Exit code is not 0"
+
+    for name in ['allACTFiles', 'allAGSFiles']:
+        path = os.path.join(tmpdir.__str__(), name + '.' + file_format)
+        if file_format == 'parquet':
+            table = pyarrow.parquet.read_table(path)
+        else:
+            table = pyarrow.ipc.open_file(pyarrow.memory_map(path)).read_all()
+
+        with open(os.path.join(tmpdir.__str__(), name + '.txt')) as f:
+            lines = [line.rstrip('\n').split(' ') for line in f][1:]
+
+        assert table.num_rows == len(lines), "{} doesn't have every row".format(name)
+        for column in ['expname', 'item', 'code', 'subjectnr']:
+            index = table.column_names.index(column)
+            values = [line[index] for line in lines]
+            if column in ['code', 'subjectnr']:
+                values = [int(x) for x in values]
+            assert table.column(column).to_pylist() == values, "{} differs in {}".format(column, name)
+        assert pyarrow.types.is_int64(table.schema.field('subjectnr').type)
+
+
+@pytest.mark.parametrize('compress', ['gzip', 'zstd'])
+def test_compressed(tmpdir: LocalPath, compress):
+    """Compressed input files should give the same output, and the combined files should be written compressed
+
+    :param tmpdir:
+    :param compress:
+    :return:
+    """
+    import gzip
+    if compress == 'zstd':
+        zstandard = pytest.importorskip('zstandard')
+        open_compressed, extension = zstandard.open, '.zst'
+    else:
+        open_compressed, extension = gzip.open, '.gz'
+
+    result_path = os.path.join(tmpdir.__str__(), 'results')
+    output_path = os.path.join(tmpdir.__str__(), 'output')
+    os.mkdir(result_path)
+    os.mkdir(output_path)
+
+    # Compress every input file, except for the agc file of the first participant
+    for file in os.listdir('test_cases/correct'):
+        if file.endswith('.act') or file.startswith('all'):
+            continue
+        if file == 'test1.agc':
+            shutil.copy(os.path.join('test_cases/correct', file), result_path)
+            continue
+        with open(os.path.join('test_cases/correct', file), 'rb') as f:
+            with open_compressed(os.path.join(result_path, file + extension), 'wb') as output_file:
+                output_file.write(f.read())
+
+    for incremental in [False, True]:
+        shutil.rmtree(output_path)
+        os.mkdir(output_path)
+        config = process_fixation_output.FixationConfig(compress=compress, incremental=incremental)
+        assert run_main(result_path, output_path, config) == 0, "Exit code is not 0"
+
+        for file in ['allACTFiles.txt', 'allAGSFiles.txt']:
+            with open(os.path.join('test_cases/correct', file), 'rb') as f:
+                expected = f.read()
+            with open_compressed(os.path.join(output_path, file + extension), 'rb') as f:
+                assert f.read() == expected, "{} is not identical!".format(file)
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_pipeline(tmpdir: LocalPath, stream):
+    """Overlapping reading, processing and writing should give the exact same output
+
+    :param tmpdir:
+    :param stream:
+    :return:
+    """
+    process_fixation_output._ags_chunk_size = 4096
+    try:
+        config = process_fixation_output.FixationConfig(pipeline=True, stream=stream)
+        assert run_main('test_cases/correct/', tmpdir.__str__(), config) == 0, "Exit code is not 0"
+    finally:
+        process_fixation_output._ags_chunk_size = 1024 * 1024
+
+    assert filecmp.cmp('test_cases/correct/allACTFiles.txt', tmpdir.__str__() + '/allACTFiles.txt', False), \
+        "Output files are not identical!"
+    assert filecmp.cmp('test_cases/correct/allAGSFiles.txt', tmpdir.__str__() + '/allAGSFiles.txt', False), \
+        "Output files are not identical!"
+
+
+@pytest.mark.parametrize('folder, exit_code', [('test_cases/malformed_agc/', 4), ('test_cases/malformed_ags/', 2)])
+def test_pipeline_malformed(tmpdir: LocalPath, folder, exit_code):
+    """Malformed files should give the same exit codes when the pipeline is enabled
+
+    :param tmpdir:
+    :param folder:
+    :param exit_code:
+    :return:
+    """
+    config = process_fixation_output.FixationConfig(pipeline=True)
+    assert run_main(folder, tmpdir.__str__(), config) == exit_code, "Exit code is not {}".format(exit_code)
+
+
+def test_pipeline_malformed_run_again(tmpdir: LocalPath):
+    """The files read ahead by a pipeline that stopped should not be used by the next run, which should read the
+    current files
+
+    :param tmpdir:
+    :return:
+    """
+    data = os.path.join(tmpdir.__str__(), 'data')
+    output = os.path.join(tmpdir.__str__(), 'output')
+    os.mkdir(output)
+    shutil.copytree('test_cases/correct', data)
+
+    # Stop at the first participant, while the files of the next participants are read ahead
+    with open(os.path.join(data, 'test1.agc'), 'a') as f:
+        f.write('derp\n')
+    assert run_main(data, output, process_fixation_output.FixationConfig(pipeline=True)) == 4, "Exit code is not 4"
+
+    # Fix the file, and leave only the header in the JNF file of a participant that was read ahead
+    shutil.copy('test_cases/correct/test1.agc', data)
+    with open(os.path.join(data, 'test3.JNF')) as f:
+        header = f.readline()
+    with open(os.path.join(data, 'test3.JNF'), 'w') as f:
+        f.write(header)
+
+    assert run_main(data, output) == 0, "Exit code is not 0"
+    with open(os.path.join(output, 'test3.act')) as f:
+        assert all(line.split()[29] == '0' for line in f.readlines()[1:]), "The files read ahead were used again"
+    assert filecmp.cmp('test_cases/correct/test2.act', os.path.join(output, 'test2.act'), False), \
+        "Output files are not identical!"
+
+
+def test_prefetch():
+    """prefetch should give all items in order, and raise the errors of the background thread"""
+    assert list(process_fixation_output.prefetch(iter(range(100)), 2)) == list(range(100))
+
+    def failing():
+        yield 1
+        raise ValueError('broken')
+
+    items = process_fixation_output.prefetch(failing(), 2)
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_all_merge(tmpdir: LocalPath):
+    """--all should process every folder with Fixation files in parallel, and --merge should merge their output into
+    study files with a folder column
+
+    :param tmpdir:
+    :return:
+    """
+    for name in ['session 1', 'session2']:
+        path = os.path.join(tmpdir.__str__(), 'study', name)
+        shutil.copytree('test_cases/correct', path)
+        os.remove(os.path.join(path, 'allACTFiles.txt'))
+        os.remove(os.path.join(path, 'allAGSFiles.txt'))
+
+    script = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, 'process_fixation_output.py')
+    process = subprocess.Popen([sys.executable, script, '--all', '--merge', '--jobs', '2', 'study', tmpdir.__str__()],
+                               cwd=tmpdir.__str__(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+    output = process.communicate(timeout=60)[0].decode()
+    assert process.returncode == 0, output
+
+    for name in ['ACT', 'AGS']:
+        with open('test_cases/correct/all{}Files.txt'.format(name)) as f:
+            expected = f.readlines()
+
+        with open(os.path.join(tmpdir.__str__(), 'study{}Files.txt'.format(name))) as f:
+            lines = f.readlines()
+
+        assert lines[0] == 'folder ' + expected[0]
+        assert lines[1:] == ['study/session_1 ' + x for x in expected[1:]] + \
+            ['study/session2 ' + x for x in expected[1:]]
+
+
+def read_combined_rows(name):
+    """Returns the rows of a combined file of the correct test case, split into columns"""
+    with open('test_cases/correct/{}'.format(name)) as f:
+        return [line.rstrip('\n').split(' ') for line in f.readlines()[1:]]
+
+
+@pytest.mark.parametrize('engine', ['python', 'hash', 'numpy'])
+def test_fixation_processor(engine):
+    """FixationProcessor should give the rows of the combined files, without writing anything"""
+    before = sorted(os.listdir('test_cases/correct'))
+    processor = process_fixation_output.FixationProcessor('test_cases/correct',
+                                                          process_fixation_output.FixationConfig(engine=engine))
+
+    act_rows = list(processor.act_rows())
+    assert [[str(x) for x in row] for row in act_rows] == read_combined_rows('allACTFiles.txt')
+    assert all(len(row) == len(processor.act_columns) for row in act_rows)
+    assert isinstance(act_rows[0][processor.act_columns.index('totfixdur')], int)
+
+    ags_rows = list(processor.ags_rows())
+    assert ags_rows == read_combined_rows('allAGSFiles.txt')
+    assert all(len(row) == len(processor.ags_columns) for row in ags_rows)
+
+    assert sorted(os.listdir('test_cases/correct')) == before
+    assert processor.records
+
+
+def test_fixation_processor_threads():
+    """Multiple FixationProcessors should be usable at the same time in different threads"""
+    expected = read_combined_rows('allACTFiles.txt')
+    results = {}
+
+    def run(number):
+        processor = process_fixation_output.FixationProcessor('test_cases/correct')
+        results[number] = [[str(x) for x in row] for row in processor.act_rows()]
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8
+    assert all(rows == expected for rows in results.values())
+
+
+@pytest.mark.parametrize('folder, rows, exit_code', [('test_cases/malformed_agc/', 'act_rows', 4),
+                                                     ('test_cases/malformed_ags/', 'ags_rows', 2)])
+def test_fixation_processor_malformed(folder, rows, exit_code):
+    """FixationProcessor should raise a FixationError with the exit code of the script instead of stopping"""
+    processor = process_fixation_output.FixationProcessor(folder)
+    with pytest.raises(process_fixation_output.FixationError) as e:
+        list(getattr(processor, rows)())
+
+    assert e.value.code == exit_code
+
+
+def test_fixation_processor_invalid_path(tmpdir: LocalPath):
+    """FixationProcessor should raise a FixationError with exit code 5 for a folder without Fixation files"""
+    with pytest.raises(process_fixation_output.FixationError) as e:
+        process_fixation_output.FixationProcessor(tmpdir.__str__())
+
+    assert e.value.code == 5
+
+
+def test_iter_act_and_ags_rows():
+    """iter_act and iter_ags_rows should give the same rows as the lists they replace, one at a time"""
+    trt = process_fixation_output.make_trt_hashed('test_cases/correct/test1.JNF')
+    rows = process_fixation_output.iter_act(trt, 'test_cases/correct/test1.agc')
+    act = process_fixation_output.make_act(trt, 'test_cases/correct/test1.agc')
+    assert next(rows) == act[0]
+    assert [act[0]] + list(rows) == act
+
+    ags_rows = list(process_fixation_output.iter_ags_rows('test_cases/correct/test1.ags',
+                                                          process_fixation_output.ImgfileSplits()))
+    assert ags_rows == read_combined_rows('allAGSFiles.txt')[:len(ags_rows)]
+
+
+def make_malformed_folder(path):
+    """Copies the correct test case to a folder and adds malformed lines to a JNF, agc and ags file
+
+    :param path: The folder to create
+    :return: The number of lines of every changed file before the malformed lines were added
+    """
+    shutil.copytree('test_cases/correct', path)
+    lengths = {}
+
+    with open(os.path.join(path, 'test2.JNF')) as f:
+        columns = f.readlines()[-1].rstrip('\n').split(' ')
+    columns[10] = 'abc'
+    appended = {'test2.JNF': ['TST A000.BMP 11', ' '.join(columns)], 'test1.agc': ['derp'],
+                'test3.ags': ['ME IS MALFORMED']}
+
+    for name, lines in appended.items():
+        with open(os.path.join(path, name)) as f:
+            lengths[name] = len(f.readlines())
+        with open(os.path.join(path, name), 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    return lengths
+
+
+@pytest.mark.parametrize('engine', ['python', 'hash', 'numpy'])
+def test_lenient(tmpdir: LocalPath, engine):
+    """In lenient mode, malformed lines should be left out and written to a quarantine report with their line numbers,
+    instead of stopping the script
+
+    :param tmpdir:
+    :param engine:
+    :return:
+    """
+    data = os.path.join(tmpdir.__str__(), 'data')
+    output = os.path.join(tmpdir.__str__(), 'output')
+    os.mkdir(output)
+    lengths = make_malformed_folder(data)
+
+    config = process_fixation_output.FixationConfig(engine=engine, lenient=True)
+    assert run_main(data, output, config) == 0, "Exit code is not 0"
+
+    # The malformed lines don't change the output
+    assert filecmp.cmp('test_cases/correct/allACTFiles.txt', output + '/allACTFiles.txt', False), \
+        "Output files are not identical!"
+    assert filecmp.cmp('test_cases/correct/allAGSFiles.txt', output + '/allAGSFiles.txt', False), \
+        "Output files are not identical!"
+
+    expected = {'test2.JNF': [lengths['test2.JNF'] + 1, lengths['test2.JNF'] + 2],
+                'test1.agc': [lengths['test1.agc'] + 1], 'test3.ags': [lengths['test3.ags'] + 1]}
+    assert sorted(x for x in os.listdir(output) if x.endswith('.quarantine.txt')) == \
+        sorted(name + '.quarantine.txt' for name in expected)
+    for name, line_numbers in expected.items():
+        with open(os.path.join(output, name + '.quarantine.txt')) as f:
+            lines = f.readlines()
+        assert lines[0] == 'line\treason\ttext\n'
+        assert [int(line.split('\t')[0]) for line in lines[1:]] == line_numbers
+
+
+def test_lenient_incremental(tmpdir: LocalPath):
+    """Quarantined lines are not part of allAGSFiles.txt, so the next incremental run should still find the lines of
+    the unchanged ags files after them
+
+    :param tmpdir:
+    :return:
+    """
+    data = os.path.join(tmpdir.__str__(), 'data')
+    output = os.path.join(tmpdir.__str__(), 'output')
+    os.mkdir(output)
+    make_malformed_folder(data)
+
+    config = process_fixation_output.FixationConfig(lenient=True, incremental=True)
+    assert run_main(data, output, config) == 0, "Exit code is not 0"
+
+    # Remove the malformed line again, the ags files after it are then reused
+    shutil.copy('test_cases/correct/test3.ags', data)
+    assert run_main(data, output, config) == 0, "Exit code is not 0"
+
+    assert filecmp.cmp('test_cases/correct/allAGSFiles.txt', output + '/allAGSFiles.txt', False), \
+        "Output files are not identical!"
+
+
+def test_fixation_processor_lenient(tmpdir: LocalPath):
+    """A lenient FixationProcessor should leave out malformed rows and keep them in its quarantine"""
+    data = os.path.join(tmpdir.__str__(), 'data')
+    lengths = make_malformed_folder(data)
+
+    processor = process_fixation_output.FixationProcessor(data, process_fixation_output.FixationConfig(lenient=True))
+    assert [[str(x) for x in row] for row in processor.act_rows()] == read_combined_rows('allACTFiles.txt')
+    assert list(processor.ags_rows()) == read_combined_rows('allAGSFiles.txt')
+
+    assert sorted(os.path.basename(path) for path in processor.quarantine) == ['test1.agc', 'test2.JNF', 'test3.ags']
+    assert [x[0] for x in processor.quarantine[os.path.join(data, 'test1.agc')]] == [lengths['test1.agc']]
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_resume(tmpdir: LocalPath, incremental):
+    """A resumed run should not process the participants finished by the interrupted run again, and give the same
+    output as a complete run
+
+    :param tmpdir:
+    :param incremental:
+    :return:
+    """
+    data = os.path.join(tmpdir.__str__(), 'data')
+    output = os.path.join(tmpdir.__str__(), 'output')
+    os.mkdir(output)
+    shutil.copytree('test_cases/correct', data)
+
+    # Stop the first run at the fourth participant with a malformed line
+    with open(os.path.join(data, 'test4.agc'), 'a') as f:
+        f.write('derp\n')
+
+    config = process_fixation_output.FixationConfig(incremental=incremental)
+    assert run_main(data, output, config) == 4, "Exit code is not 4"
+
+    with open(os.path.join(output, '.fixation_journal')) as f:
+        assert [json.loads(line)['participant'] for line in f] == ['test1', 'test2', 'test3']
+    assert not os.path.exists(os.path.join(output, 'test4.act'))
+    assert not [x for x in os.listdir(output) if x.endswith('.tmp')]
+    mtimes = dict((x, os.path.getmtime(os.path.join(output, x + '.act'))) for x in ['test1', 'test2', 'test3'])
+
+    # Resume after fixing the file
+    shutil.copy('test_cases/correct/test4.agc', os.path.join(data, 'test4.agc'))
+    assert run_main(data, output, config.replace(resume=True)) == 0, "Exit code is not 0"
+
+    assert mtimes == dict((x, os.path.getmtime(os.path.join(output, x + '.act'))) for x in mtimes), \
+        "Finished participants were processed again"
+    assert not os.path.exists(os.path.join(output, '.fixation_journal'))
+    assert filecmp.cmp('test_cases/correct/allACTFiles.txt', output + '/allACTFiles.txt', False), \
+        "Output files are not identical!"
+    assert filecmp.cmp('test_cases/correct/allAGSFiles.txt', output + '/allAGSFiles.txt', False), \
+        "Output files are not identical!"
+
+
+def summarize_ags_lines(lines):
+    """Summarizes the regions of the lines of an ags file the slow way, to compare allAGSSummary.txt with"""
+    regions = {}
+    order = []
+    for line in lines:
+        columns = line.rstrip('\n').split(' ')
+        key = (columns[4], columns[1], columns[14])
+        if key not in regions:
+            regions[key] = [0, {}]
+            order.append(key)
+        regions[key][0] += 1
+        if columns[8] == 'F':
+            regions[key][1].setdefault(columns[9], (max(int(columns[10]), 0), columns[11] != '0'))
+
+    rows = []
+    for subjectnr, imgfile, code in order:
+        samples, fixations = regions[(subjectnr, imgfile, code)]
+        rows.append([subjectnr, imgfile[0], imgfile[1:4], code, str(samples), str(len(fixations)),
+                     str(sum(x[0] for x in fixations.values())), str(sum(x[1] for x in fixations.values()))])
+
+    return rows
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_ags_summary(tmpdir: LocalPath, incremental):
+    """allAGSSummary.txt should summarize the samples and fixations of every region of every ags file
+
+    :param tmpdir:
+    :param incremental:
+    :return:
+    """
+    expected = []
+    for number in range(1, 6):
+        with open('test_cases/correct/test{}.ags'.format(number)) as f:
+            expected += summarize_ags_lines(f.readlines()[1:])
+
+    config = process_fixation_output.FixationConfig(ags_summary=True, incremental=incremental)
+    assert run_main('test_cases/correct/', tmpdir.__str__(), config) == 0, "Exit code is not 0"
+    if incremental:
+        # A second run should summarize the unchanged ags files again if the summary is missing
+        os.remove(os.path.join(tmpdir.__str__(), 'allAGSSummary.txt'))
+        assert run_main('test_cases/correct/', tmpdir.__str__(), config) == 0, "Exit code is not 0"
+
+    with open(os.path.join(tmpdir.__str__(), 'allAGSSummary.txt')) as f:
+        lines = f.readlines()
+
+    assert lines[0] == 'subjectnr cond item code samples totfixcnt totfixdur NumFixQualNot0\n'
+    assert [line.rstrip('\n').split(' ') for line in lines[1:]] == expected
+    assert filecmp.cmp('test_cases/correct/allAGSFiles.txt', tmpdir.__str__() + '/allAGSFiles.txt', False), \
+        "Output files are not identical!"
+
+
+def test_profile(tmpdir: LocalPath):
+    """--profile and --trace-memory should write the profile and the memory report to the output folder
+
+    :param tmpdir:
+    :return:
+    """
+    import pstats
+
+    # Tracing the memory makes the run a lot slower, so only one participant is used
+    for extension in ['JNF', 'agc', 'ags']:
+        shutil.copy('test_cases/correct/test1.' + extension, tmpdir.__str__())
+
+    config = process_fixation_output.FixationConfig(profile=True, trace_memory=True, report='json')
+    assert run_main(tmpdir.__str__(), tmpdir.__str__(), config) == 0, "Exit code is not 0"
+
+    assert filecmp.cmp('test_cases/correct/test1.act', tmpdir.__str__() + '/test1.act', False), \
+        "Output files are not identical!"
+
+    stats = pstats.Stats(os.path.join(tmpdir.__str__(), 'fixation_profile.prof'))
+    assert 'make_trt' in [function for path, line, function in stats.stats]
+
+    with open(os.path.join(tmpdir.__str__(), 'fixation_profile.txt')) as f:
+        stages = dict((line.split(' ')[0], line.split(' ')[1]) for line in f.read().split('\n\n')[0].splitlines()[1:])
+    assert stages['sort_jnf_file'] == '1' and stages['make_trt'] == '1' and stages['make_act'] == '1'
+    assert stages['make_trt_hashed'] == '0'
+
+    with open(os.path.join(tmpdir.__str__(), 'fixation_memory.txt')) as f:
+        report = f.read()
+    peaks = dict(line.split(' ') for line in report.split('\n\n')[0].splitlines()[1:])
+    assert all(int(peaks[stage]) > 0 for stage in ['sort_jnf_file', 'make_trt', 'make_act', 'combine_ags_files'])
+    assert 'Top allocations' in report
+
+    # The run report should get the traced peak of every stage as well
+    with open(os.path.join(tmpdir.__str__(), 'fixation_report.json')) as f:
+        records = json.load(f)['stages']
+    assert all(record['traced_peak_memory'] > 0 for record in records)
+    assert not process_fixation_output.tracemalloc.is_tracing(), "Tracing should stop after the run"